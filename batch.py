@@ -0,0 +1,189 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+
+def idle_policy(policy_rng):
+    def policy(tick):
+        return 0
+    return policy
+
+def sweep_policy(policy_rng):
+    def policy(tick):
+        return main.CONTROL_SHOOT | (main.CONTROL_LEFT if tick // 120 % 2 else main.CONTROL_RIGHT)
+    return policy
+
+def dodge_policy(policy_rng):
+    # shoot constantly and sidestep the lowest hazard above the ship
+    def policy(tick):
+        ship = main.player.rect
+        controls = main.CONTROL_SHOOT
+        lowest = None
+        for group in (main.meteor_sprites, main.enemy_sprites, main.enemy_laser_sprites):
+            for sprite in group:
+                rect = sprite.rect
+                if rect.bottom < ship.bottom and abs(rect.centerx - ship.centerx) < 120:
+                    if lowest is None or rect.bottom > lowest.bottom:
+                        lowest = rect
+        if lowest:
+            controls |= main.CONTROL_LEFT if lowest.centerx > ship.centerx else main.CONTROL_RIGHT
+        return controls
+    return policy
+
+POLICIES = {
+    'idle': idle_policy,
+    'random': main.random_policy,
+    'sweep': sweep_policy,
+    'dodge': dodge_policy
+}
+
+def init_worker(bundle):
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    main.init_game(headless=True, bundle=bundle)
+
+def run_game(job):
+    seed, policy_name, config_name, config, max_ticks = job
+    main.reset_session(seed, config)
+    main.start_or_restart()
+    policy = POLICIES[policy_name](random.Random(seed))
+
+    costs = []
+    for tick in range(max_ticks):
+        start = time.perf_counter()
+        main.simulate(main.FIXED_DT, policy(tick))
+        costs.append(time.perf_counter() - start)
+        if main.game_state == main.GameState.GAME_OVER:
+            break
+
+    died = main.game_state == main.GameState.GAME_OVER
+    late = costs[len(costs) * 3 // 4:]
+    return {
+        'seed': seed,
+        'policy': policy_name,
+        'config': config_name,
+        'score': main.final_score if died else main.score,
+        'died': died,
+        'ticks': len(costs),
+        'survival': main.game_clock.time,
+        'hits_per_second': main.hit_count / main.game_clock.time if main.game_clock.time else 0.0,
+        'tick_ms': sum(costs) / len(costs) * 1000,
+        'late_tick_ms': sum(late) / len(late) * 1000,
+        'worst_tick_ms': max(costs) * 1000
+    }
+
+def parse_sweep(settings):
+    # --set meteor_cap=5,8 --set difficulty=1,1.5 expands to every combination
+    axes = []
+    for setting in settings:
+        key, _, values = setting.partition('=')
+        if key not in main.SPAWN_CONFIG or not values:
+            raise ValueError(f"expected one of {', '.join(main.SPAWN_CONFIG)}=VALUE[,VALUE...], got {setting!r}")
+        cast = type(main.SPAWN_CONFIG[key])
+        axes.append([(key, cast(value)) for value in values.split(',')])
+
+    configs = {}
+    for combination in itertools.product(*axes):
+        name = ' '.join(f'{key}={value}' for key, value in combination) or 'default'
+        configs[name] = dict(combination)
+    return configs
+
+def percentile(ordered, fraction):
+    return ordered[round((len(ordered) - 1) * fraction)]
+
+def summarize(results):
+    groups = {}
+    for result in results:
+        groups.setdefault((result['config'], result['policy']), []).append(result)
+
+    rows = []
+    for (config, policy), games in groups.items():
+        scores = sorted(game['score'] for game in games)
+        survival = sorted(game['survival'] for game in games)
+        rows.append({
+            'config': config,
+            'policy': policy,
+            'games': len(games),
+            'score_mean': sum(scores) / len(scores),
+            'score_p50': percentile(scores, 0.5),
+            'score_p95': percentile(scores, 0.95),
+            'survival_mean': sum(survival) / len(survival),
+            'survival_max': survival[-1],
+            'deaths': sum(game['died'] for game in games),
+            'hits_per_second': sum(game['hits_per_second'] for game in games) / len(games),
+            'tick_ms': sum(game['tick_ms'] for game in games) / len(games),
+            'late_tick_ms': max(game['late_tick_ms'] for game in games),
+            'worst_tick_ms': max(game['worst_tick_ms'] for game in games)
+        })
+    return rows
+
+def print_table(rows, file=sys.stdout):
+    width = max([len(row['config']) for row in rows] + [6])
+    print(f"{'config':<{width}}  {'policy':<6} {'games':>6} {'score':>8} {'p50':>6} {'p95':>6} "
+          f"{'alive s':>8} {'max s':>7} {'deaths':>6} {'hits/s':>7} {'tick ms':>8} {'late ms':>8} {'worst ms':>8}",
+          file=file)
+    for row in rows:
+        print(f"{row['config']:<{width}}  {row['policy']:<6} {row['games']:>6} {row['score_mean']:>8.1f} "
+              f"{row['score_p50']:>6} {row['score_p95']:>6} {row['survival_mean']:>8.1f} {row['survival_max']:>7.1f} "
+              f"{row['deaths']:>6} {row['hits_per_second']:>7.2f} {row['tick_ms']:>8.3f} "
+              f"{row['late_tick_ms']:>8.3f} {row['worst_tick_ms']:>8.3f}", file=file)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Run many headless games in parallel and summarize them')
+    parser.add_argument('--games', type=int, default=100, help='games per config and policy')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, later games count up')
+    parser.add_argument('--policy', action='append', choices=POLICIES,
+                        help='player policy, may be repeated (default: random)')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUES',
+                        help=f"spawn setting to sweep, one of: {', '.join(main.SPAWN_CONFIG)}")
+    parser.add_argument('--max-ticks', type=int, default=36000, help='stop a game that survives this long')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--bundle', default=main.BUNDLE_PATH, help='asset bundle the workers load')
+    parser.add_argument('--output', help='also write every game result to this JSON lines file')
+    args = parser.parse_args()
+    try:
+        configs = parse_sweep(args.set)
+    except ValueError as error:
+        parser.error(str(error))
+    # check every combination here rather than as a traceback from a worker
+    for name, config in configs.items():
+        config = dict(main.SPAWN_CONFIG, **config)
+        try:
+            main.validate_spawn_config(config)
+            main.load_waves(config['waves'])
+        except (OSError, ValueError) as error:
+            parser.error(f"{name}: {error}")
+
+    jobs = [
+        (args.seed + game, policy, name, config, args.max_ticks)
+        for name, config in configs.items()
+        for policy in args.policy or ['random']
+        for game in range(args.games)
+    ]
+
+    output = open(args.output, 'w') if args.output else None
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(args.bundle,)) as executor:
+        chunksize = max(1, min(16, len(jobs) // (args.jobs * 8)))
+        for result in executor.map(run_game, jobs, chunksize=chunksize):
+            results.append(result)
+            if output:
+                output.write(json.dumps(result) + '\n')
+            if len(results) % 100 == 0 or len(results) == len(jobs):
+                elapsed = time.perf_counter() - start
+                print(f"\r{len(results)}/{len(jobs)} games, {len(results) / elapsed * 60:.0f} games/min",
+                      end='', file=sys.stderr)
+    print(file=sys.stderr)
+    if output:
+        output.close()
+
+    print_table(summarize(results))
+
+if __name__ == '__main__':
+    main_cli()
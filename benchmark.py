@@ -0,0 +1,188 @@
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pygame
+import main
+
+PHASES = ('update', 'collisions', 'background', 'score', 'draw', 'flip')
+
+SCENARIOS = {
+    'menu': {'state': main.GameState.MENU},
+    'light': {'meteors': 5, 'enemies': 3},
+    'meteors': {'meteors': 200},
+    'lasers': {'lasers': 2000},
+    'crowd': {'meteors': 500, 'enemies': 40}
+}
+
+def setup(config):
+    for sprite in main.all_sprites.sprites():
+        sprite.kill()
+    main.reset_game()
+    main.game_state = config.get('state', main.GameState.PLAYING)
+    # the scenario tops up its own counts, so the waves would only pile more on top
+    main.wave_scheduler.paused = True
+    # keep the player alive so every scenario runs at a constant entity count
+    main.player.invincible = True
+
+def populate(config):
+    rng = main.rng
+    groups = (main.all_sprites, main.meteor_sprites)
+    while len(main.meteor_sprites) < config.get('meteors', 0):
+        pos = (rng.randint(0, main.WINDOW_WIDTH), rng.randint(-100, main.WINDOW_HEIGHT))
+        main.Meteor(main.meteor_surf, pos, groups, rng)
+    while len(main.enemy_sprites) < config.get('enemies', 0):
+        main.EnemyShip((main.all_sprites, main.enemy_sprites), rng)
+    groups = (main.all_sprites, main.laser_sprites)
+    while len(main.laser_sprites) < config.get('lasers', 0):
+        pos = (rng.randint(0, main.WINDOW_WIDTH), rng.randint(0, main.WINDOW_HEIGHT + 60))
+        main.laser_pool.spawn(main.laser_surf, pos, groups)
+
+def run_frame(config, timings):
+    populate(config)
+    profiler = main.profiler
+    # run the game's own tick and render, and read the phases from the profiler sections they report
+    profiler.sections = {}
+    start = time.perf_counter()
+    main.simulate(main.FIXED_DT)
+    with profiler.section('render'):
+        main.render()
+    with profiler.section('flip'):
+        pygame.display.flip()
+    end = time.perf_counter()
+
+    sections = profiler.sections
+    for phase in ('update', 'collisions', 'background', 'score', 'flip'):
+        timings[phase].append(sections.get(phase, 0.0))
+    # render also covers the background and score sections nested inside it
+    timings['draw'].append(sections['render'] - sections.get('background', 0.0) - sections.get('score', 0.0))
+    timings['frame'].append(end - start)
+
+def summarize(samples):
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p95': ordered[round(last * 0.95)] * 1000,
+        'p99': ordered[round(last * 0.99)] * 1000
+    }
+
+def run_scenario(name, frames, warmup, alloc_frames):
+    config = SCENARIOS[name]
+    setup(config)
+    timings = {phase: [] for phase in PHASES + ('frame',)}
+    for i in range(warmup):
+        run_frame(config, {phase: [] for phase in timings})
+
+    collections = sum(stat['collections'] for stat in gc.get_stats())
+    for i in range(frames):
+        run_frame(config, timings)
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - collections
+
+    allocated = []
+    tracemalloc.start()
+    for i in range(alloc_frames):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run_frame(config, {phase: [] for phase in timings})
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    frame = summarize(timings['frame'])
+    return {
+        'fps': 1000 / frame['mean'],
+        'frame_ms': frame,
+        'phases_ms': {phase: summarize(timings[phase]) for phase in PHASES},
+        'alloc_kib_per_frame': sum(allocated) / len(allocated) / 1024 if allocated else 0.0,
+        'gc_collections': collections,
+        'sprites': {
+            'meteors': len(main.meteor_sprites),
+            'enemies': len(main.enemy_sprites),
+            'lasers': len(main.laser_sprites),
+            'enemy_lasers': len(main.enemy_laser_sprites),
+            'all': len(main.all_sprites)
+        }
+    }
+
+def commit_hash():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, baseline=None):
+    startup = results['startup_ms']
+    line = f"startup: menu {startup['menu']:.1f} ms, playable {startup['playable']:.1f} ms"
+    if baseline and 'startup_ms' in baseline:
+        line += f" (baseline {baseline['startup_ms']['menu']:.1f} / {baseline['startup_ms']['playable']:.1f} ms)"
+    print(line, file=sys.stderr)
+    for name, result in results['scenarios'].items():
+        print(f"{name}: {result['fps']:.0f} fps, {result['alloc_kib_per_frame']:.1f} KiB/frame, "
+              f"{result['gc_collections']} gc runs", file=sys.stderr)
+        old = baseline['scenarios'].get(name) if baseline else None
+        for phase, stats in list(result['phases_ms'].items()) + [('frame', result['frame_ms'])]:
+            line = f"  {phase:<11} mean {stats['mean']:7.3f}  p95 {stats['p95']:7.3f}  p99 {stats['p99']:7.3f} ms"
+            if old:
+                # results from before a phase was split out have no entry for it
+                previous = old['frame_ms'] if phase == 'frame' else old['phases_ms'].get(phase)
+                if previous and previous['mean']:
+                    line += f"  ({(stats['mean'] / previous['mean'] - 1) * 100:+.1f}% vs baseline)"
+            print(line, file=sys.stderr)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Benchmark the space shooter frame loop headlessly')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--frames', type=int, default=600, help='measured frames per scenario')
+    parser.add_argument('--warmup', type=int, default=60, help='unmeasured frames before each scenario')
+    parser.add_argument('--alloc-frames', type=int, default=60, help='frames traced for allocations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--renderer', choices=('batched', 'group'), default='batched',
+                        help='draw sprites with the batched fblits renderer or plain Group.draw')
+    parser.add_argument('--render-scale', type=float, default=1.0,
+                        help='draw scenes at this fraction of the window size and scale them up')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name!r}')
+
+    main.BATCHED_RENDERING = args.renderer == 'batched'
+    main.RENDER_SCALE = args.render_scale
+    main.init_game(args.seed, headless=True, effects=True)
+    results = {
+        'commit': commit_hash(),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'frames': args.frames,
+        'seed': args.seed,
+        'renderer': args.renderer,
+        'render_scale': args.render_scale,
+        'blit_variants': main.batch_renderer.choices,
+        'startup_ms': {stage: seconds * 1000 for stage, seconds in main.startup_times.items()},
+        'scenarios': {}
+    }
+    for name in args.scenarios or SCENARIOS:
+        results['scenarios'][name] = run_scenario(name, args.frames, args.warmup, args.alloc_frames)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main_cli()
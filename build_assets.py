@@ -0,0 +1,71 @@
+import argparse
+import json
+import zlib
+
+import pygame
+import main
+
+def collect_surfaces(assets):
+    entries = []
+    for key, asset in assets.cache.items():
+        if key[0] == 'image':
+            entries.append((key, [asset]))
+        elif key[0] in ('frames', 'sequence'):
+            entries.append((key, asset))
+    return entries
+
+def pack(surfaces, width, padding=1):
+    # shelf packing, tallest first, with a transparent gutter so filtering never bleeds
+    placements = {}
+    x = y = shelf_height = 0
+    for surf in sorted(surfaces, key=lambda surf: -surf.get_height()):
+        w, h = surf.get_size()
+        if x + w > width:
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        placements[surf] = (x, y, w, h)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    return placements, y + shelf_height
+
+def build(output, width=512, compress=True):
+    main.init_game(headless=True, bundle=None)
+    entries = collect_surfaces(main.assets)
+    # sequences reuse the surfaces of their images, so each one is packed only once
+    surfaces = list({id(surf): surf for key, surfs in entries for surf in surfs}.values())
+    placements, height = pack(surfaces, width)
+
+    atlas = pygame.Surface((width, height), pygame.SRCALPHA)
+    for surf, (x, y, w, h) in placements.items():
+        atlas.blit(surf, (x, y))
+
+    header = {
+        'size': [width, height],
+        'compression': 'zlib' if compress else None,
+        'entries': [
+            [list(key), list(placements[surfs[0]]) if key[0] == 'image' else [list(placements[surf]) for surf in surfs]]
+            for key, surfs in entries
+        ]
+    }
+    pixels = pygame.image.tobytes(atlas, 'RGBA')
+    if compress:
+        pixels = zlib.compress(pixels, 9)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+
+    with open(output, 'wb') as file:
+        file.write(main.BUNDLE_MAGIC)
+        file.write(len(header_bytes).to_bytes(4, 'little'))
+        file.write(header_bytes)
+        file.write(pixels)
+    return len(entries), width, height, 8 + len(header_bytes) + len(pixels)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack every image into a single atlas bundle')
+    parser.add_argument('--output', default=main.BUNDLE_PATH)
+    parser.add_argument('--width', type=int, default=512, help='atlas width in pixels')
+    parser.add_argument('--raw', action='store_true',
+                        help='store uncompressed pixels so the atlas is read with zero copies')
+    args = parser.parse_args()
+    count, width, height, size = build(args.output, args.width, not args.raw)
+    print(f"packed {count} assets into a {width}x{height} atlas, {size / 1024:.1f} KiB -> {args.output}")
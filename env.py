@@ -0,0 +1,155 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import main
+
+# observation key and the sprite group it is read from
+GROUPS = (
+    ('meteors', 'meteor_sprites'),
+    ('enemies', 'enemy_sprites'),
+    ('enemy_lasers', 'enemy_laser_sprites'),
+    ('power_ups', 'power_up_sprites')
+)
+
+class VectorEnv:
+    def __init__(self, num_envs=8, seed=0, spawn_config=None, max_entities=16, frame_scale=None,
+                 frame_skip=1, max_episode_steps=None, bundle=main.BUNDLE_PATH):
+        if not pygame.display.get_init():
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            main.init_game(seed, headless=True, bundle=bundle, effects=False)
+        if frame_scale:
+            # draw straight at the observation size instead of scaling full frames down
+            main.set_render_scale(frame_scale)
+        self.num_envs = num_envs
+        self.seed = seed
+        self.spawn_config = spawn_config
+        self.max_entities = max_entities
+        self.frame_scale = frame_scale
+        self.frame_skip = frame_skip
+        self.max_episode_steps = max_episode_steps
+        self.size = np.array([main.WINDOW_WIDTH, main.WINDOW_HEIGHT], np.float32)
+
+        # the player is x, y, invincible, rapid fire, speed boost; every entity is x, y, present,
+        # nearest to the player first, with positions as fractions of the window
+        self.observation_shapes = {'player': (num_envs, 5)}
+        for key, group in GROUPS:
+            self.observation_shapes[key] = (num_envs, max_entities, 3)
+        if frame_scale:
+            width, height = main.scene_surface.get_size()
+            self.observation_shapes['frame'] = (num_envs, height, width, 3)
+        # an action is the control bitmask of main.CONTROL_LEFT, RIGHT, UP, DOWN and SHOOT
+        self.num_actions = 1 << len(main.CONTROL_KEYS)
+
+        self.sessions = [main.GameSession(seed + i, spawn_config) for i in range(num_envs)]
+        self.scores = np.zeros(num_envs, np.int64)
+        self.steps = np.zeros(num_envs, np.int64)
+        self.episodes = 0
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+        observation = self.empty_observation()
+        for i, session in enumerate(self.sessions):
+            session.load()
+            session.reset(self.seed + i, self.spawn_config)
+            main.start_or_restart()
+            self.observe(i, observation)
+            session.save()
+        self.scores[:] = 0
+        self.steps[:] = 0
+        return observation, {}
+
+    def step(self, actions):
+        actions = np.asarray(actions, np.int64)
+        rewards = np.zeros(self.num_envs, np.float32)
+        terminated = np.zeros(self.num_envs, bool)
+        truncated = np.zeros(self.num_envs, bool)
+        final_scores = np.full(self.num_envs, -1, np.int64)
+        observation = self.empty_observation()
+
+        for i, session in enumerate(self.sessions):
+            session.load()
+            controls = int(actions[i])
+            for repeat in range(self.frame_skip):
+                main.simulate(main.FIXED_DT, controls)
+                if main.game_state == main.GameState.GAME_OVER:
+                    break
+            rewards[i] = main.score - self.scores[i]
+            self.steps[i] += 1
+
+            terminated[i] = main.game_state == main.GameState.GAME_OVER
+            truncated[i] = not terminated[i] and self.max_episode_steps and self.steps[i] >= self.max_episode_steps
+            if terminated[i] or truncated[i]:
+                # like most vector envs, finished games restart at once and report how they ended in the info
+                final_scores[i] = main.score
+                if truncated[i]:
+                    main.game_over()
+                main.start_or_restart()
+                self.steps[i] = 0
+                self.episodes += 1
+            self.scores[i] = main.score
+            self.observe(i, observation)
+            session.save()
+        return observation, rewards, terminated, truncated, {'final_score': final_scores}
+
+    def empty_observation(self):
+        observation = {key: np.zeros(shape, np.float32) for key, shape in self.observation_shapes.items()}
+        if self.frame_scale:
+            observation['frame'] = np.zeros(self.observation_shapes['frame'], np.uint8)
+        return observation
+
+    def observe(self, i, observation):
+        player = main.player
+        origin = np.array(player.rect.center, np.float32)
+        observation['player'][i] = (*(origin / self.size), player.invincible, player.rapid_fire, player.speed_boosted)
+        for key, group_name in GROUPS:
+            group = getattr(main, group_name)
+            if not group:
+                continue
+            centers = np.array([sprite.rect.center for sprite in group], np.float32)
+            nearest = np.argsort(((centers - origin) ** 2).sum(1))[:self.max_entities]
+            entities = observation[key][i]
+            entities[:len(nearest), :2] = centers[nearest] / self.size
+            entities[:len(nearest), 2] = 1
+        if self.frame_scale:
+            observation['frame'][i] = self.render_frame()
+
+    def render_frame(self):
+        surface = main.scene_surface
+        main.starfield.draw(surface)
+        main.draw_sprites(surface)
+        return pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Step many games in one process with random actions and time it')
+    parser.add_argument('--envs', type=int, default=16, help='games stepped together')
+    parser.add_argument('--steps', type=int, default=1000, help='vector steps to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-entities', type=int, default=16, help='entities observed per group')
+    parser.add_argument('--frame-scale', type=float, help='also observe the screen at this fraction of its size')
+    parser.add_argument('--frame-skip', type=int, default=1, help='ticks each action is held for')
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs, args.seed, max_entities=args.max_entities, frame_scale=args.frame_scale,
+                    frame_skip=args.frame_skip)
+    env.reset()
+    action_rng = np.random.default_rng(args.seed)
+    scores = []
+    start = time.perf_counter()
+    for step in range(args.steps):
+        observation, rewards, terminated, truncated, info = env.step(action_rng.integers(env.num_actions, size=args.envs))
+        scores.extend(info['final_score'][info['final_score'] >= 0].tolist())
+    elapsed = time.perf_counter() - start
+
+    env_steps = args.envs * args.steps
+    print(f"{env_steps} env steps in {elapsed:.2f} s, {env_steps / elapsed:.0f} steps/s, "
+          f"{len(scores)} episodes, mean score {np.mean(scores) if scores else 0:.1f}", file=sys.stderr)
+    print({key: value.shape for key, value in observation.items()}, file=sys.stderr)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,49 @@
+from heapq import heappush, heappop
+
+class GameClock:
+    def __init__(self):
+        self.time = 0.0
+        self.scale = 1.0
+        self.paused = False
+        self.timers = []
+        self.cancelled = set()
+        self.seq = 0
+        self.fired = 0
+
+    def schedule(self, delay, callback, *args):
+        timer = self.seq
+        self.seq += 1
+        heappush(self.timers, (self.time + delay, timer, callback, args))
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None:
+            self.cancelled.add(timer)
+
+    def clear(self):
+        self.timers = []
+        self.cancelled = set()
+
+    def pending(self):
+        return len(self.timers) - len(self.cancelled)
+
+    def advance(self, dt):
+        self.time += dt
+        # timers set while firing wait for the next advance, even with no delay
+        limit = self.seq
+        timers = self.timers
+        while timers and timers[0][0] <= self.time and timers[0][1] < limit:
+            due, timer, callback, args = heappop(timers)
+            if timer in self.cancelled:
+                self.cancelled.discard(timer)
+                continue
+            self.fired += 1
+            callback(*args)
+
+    def snapshot(self):
+        return (self.time, self.seq, self.timers[:], set(self.cancelled))
+
+    def restore(self, state):
+        self.time, self.seq, timers, cancelled = state
+        self.timers = timers[:]
+        self.cancelled = set(cancelled)
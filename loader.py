@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+class StagedLoader:
+    def __init__(self, steps, slice_time=0.008):
+        self.steps = steps
+        self.slice_time = slice_time
+        self.done = 0
+        self.label = steps[0][0] if steps else ''
+        self.timings = []
+
+    def progress(self):
+        return self.done / len(self.steps) if self.steps else 1.0
+
+    def finished(self):
+        return self.done == len(self.steps)
+
+    def step(self):
+        label, function = self.steps[self.done]
+        self.label = label
+        start = time.perf_counter()
+        function()
+        self.timings.append((label, time.perf_counter() - start))
+        self.done += 1
+
+    def run(self):
+        while not self.finished():
+            self.step()
+
+    async def load(self):
+        # run steps for up to a slice of time, then hand the event loop back so frames keep coming
+        slice_start = time.perf_counter()
+        while not self.finished():
+            self.step()
+            if time.perf_counter() - slice_start > self.slice_time:
+                await asyncio.sleep(0)
+                slice_start = time.perf_counter()
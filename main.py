@@ -1,12 +1,63 @@
+import argparse
 import asyncio
+import json
+import os
 import pygame
+import sys
 import time
+import weakref
+import zlib
 import math
 import random
+from collections import OrderedDict
+from operator import itemgetter
 from enum import Enum
 from os.path import join
-from random import randint, uniform
-from math import sin, cos
+from math import sin
+
+from gameclock import GameClock
+from loader import StagedLoader
+from pacing import AutoScale, FrameScheduler
+from profiler import Profiler
+from replay import ReplayWriter, read_replay
+
+try:
+    import numpy as np
+    from particles import ParticleSystem
+except ImportError:
+    np = None
+    ParticleSystem = None
+
+class TextCache:
+    def __init__(self, max_entries=512, scale_step=0.01):
+        self.max_entries = max_entries
+        self.scale_step = scale_step
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, scale=1.0):
+        bucket = round(scale / self.scale_step)
+        key = (font, text, color, bucket)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        if bucket == round(1 / self.scale_step):
+            surf = font.render(text, True, color)
+        else:
+            surf = pygame.transform.rotozoom(self.render(font, text, color), 0, bucket * self.scale_step)
+        self.entries[key] = surf
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surf
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
 
 class AnimatedText:
     def __init__(self, text, font, color, pos, size, animation_type='pulse'):
@@ -19,6 +70,11 @@ class AnimatedText:
         self.animation_type = animation_type
         self.angle = 0
 
+    def warm(self):
+        # both animations stay within about 10% of the base size
+        for step in range(-12, 13):
+            text_cache.render(self.font, self.text, self.color, 1 + step / 100)
+
     def update(self, dt):
         if self.animation_type == 'pulse':
             if self.growing:
@@ -34,9 +90,8 @@ class AnimatedText:
             self.scale = 1.0 + sin(self.angle) * 0.1
 
     def draw(self, surface):
-        text_surface = self.font.render(self.text, True, self.color)
-        scaled_surface = pygame.transform.rotozoom(text_surface, 0, self.scale)
-        rect = scaled_surface.get_rect(center=self.pos)
+        scaled_surface = text_cache.render(self.font, self.text, self.color, self.scale * render_scale)
+        rect = scaled_surface.get_rect(center=scale_point(self.pos))
         surface.blit(scaled_surface, rect)
 
 class InstructionText:
@@ -50,7 +105,73 @@ class InstructionText:
         self.rect = self.surface.get_rect(center=pos)
         
     def draw(self, surface):
-        surface.blit(self.surface, self.rect)
+        if render_scale == 1:
+            surface.blit(self.surface, self.rect)
+        else:
+            text_surf = text_cache.render(self.font, self.text, self.color, render_scale)
+            surface.blit(text_surf, text_surf.get_rect(center=scale_point(self.pos)))
+
+def scale_point(pos):
+    return (pos[0] * render_scale, pos[1] * render_scale)
+
+BACKGROUND_COLOR = '#3a2e3f'
+# star count, scroll speed in px/s, scale of star.png and opacity, from the farthest layer to the nearest
+STAR_LAYERS = (
+    (1800, 10, 0.1, 140),
+    (400, 25, 0.2, 200),
+    (40, 60, 0.45, 255)
+)
+BATCHED_RENDERING = True
+# the game world is always WINDOW_WIDTH x WINDOW_HEIGHT; scenes are drawn at this fraction of it and scaled up
+# to the window. 'auto' starts at full size and steps down RENDER_SCALES while frames run over budget
+RENDER_SCALE = 1.0
+RENDER_SCALES = (1.0, 0.75, 0.5)
+# full-frame flips are expensive on the pygbag canvas, so the web build redraws only what moved,
+# unless RENDER_SCALE asks for smaller full frames instead
+DIRTY_RENDERING = sys.platform == 'emscripten' and RENDER_SCALE == 1
+POOL_CAP = 256
+# built by build_assets.py, falls back to the individual files when missing
+BUNDLE_PATH = 'assets.bundle'
+BUNDLE_MAGIC = b'SSAB'
+# move lasers and meteors in one vectorized step per frame when numpy is available
+BATCHED_SIMULATION = np is not None
+# headless runs advance the simulation in fixed steps so they are reproducible
+FIXED_DT = 1 / 60
+# stored in every replay; bump it whenever a change makes the same seed and inputs play out differently
+RULESET = 1
+FPS_CAP = 60
+SLOW_MOTION = 0.5
+IDLE_FPS = 15
+
+CONTROL_LEFT = 1
+CONTROL_RIGHT = 2
+CONTROL_UP = 4
+CONTROL_DOWN = 8
+CONTROL_SHOOT = 16
+SPAWN_CONFIG = {
+    'waves': 'waves.json',
+    'difficulty': 1.0,
+    'meteor_cap': 96,
+    'enemy_cap': 24,
+    'power_up_cap': 4,
+    'spawns_per_tick': 4
+}
+
+SPAWN_METEOR = 0
+SPAWN_ENEMY = 1
+SPAWN_POWER_UP = 2
+SPAWN_KINDS = {'meteor': SPAWN_METEOR, 'enemy': SPAWN_ENEMY, 'power_up': SPAWN_POWER_UP}
+FORMATIONS = ('random', 'line', 'column', 'v')
+PLAN_AHEAD = 2.0
+
+CONTROL_KEYS = {
+    pygame.K_LEFT: CONTROL_LEFT,
+    pygame.K_RIGHT: CONTROL_RIGHT,
+    pygame.K_UP: CONTROL_UP,
+    pygame.K_DOWN: CONTROL_DOWN,
+    pygame.K_SPACE: CONTROL_SHOOT
+}
+
 class GameState:
     MENU = 0
     PLAYING = 1
@@ -61,10 +182,157 @@ class PowerUpType(Enum):
     RAPID_FIRE = 2
     SPEED_BOOST = 3
 
-class Player(pygame.sprite.Sprite):
+LAYER_METEOR = 0
+LAYER_POWER_UP = 1
+LAYER_LASER = 2
+LAYER_ENEMY = 3
+LAYER_PLAYER = 4
+LAYER_EFFECT = 5
+
+POWER_UP_SHEETS = {
+    PowerUpType.INVINCIBILITY: 'invincibility.png',
+    PowerUpType.RAPID_FIRE: 'rapid_fire.png',
+    PowerUpType.SPEED_BOOST: 'speed_boost.png'
+}
+
+class GameSprite(pygame.sprite.DirtySprite):
+    def __init__(self, groups):
+        super().__init__(groups)
+        self.dirty = 2
+
+class BatchedSprite(GameSprite):
+    store = None
+    slot = None
+
+    def kill(self):
+        if self.store:
+            self.store.remove(self)
+        super().kill()
+
+class EntityStore:
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.sprites = []
+        self.rects = []
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.rotation = np.zeros(capacity)
+        self.rotation_speed = np.zeros(capacity)
+        self.half_height = np.zeros(capacity)
+
+    def grow(self):
+        for name in ('pos', 'vel', 'rotation', 'rotation_speed', 'half_height'):
+            array = getattr(self, name)
+            grown = np.zeros((len(array) * 2,) + array.shape[1:])
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, sprite, velocity, rotation_speed=0):
+        if self.count == len(self.pos):
+            self.grow()
+        slot = self.count
+        self.pos[slot] = sprite.rect.center
+        self.vel[slot] = velocity
+        self.rotation[slot] = 0
+        self.rotation_speed[slot] = rotation_speed
+        self.half_height[slot] = sprite.rect.height / 2
+        self.sprites.append(sprite)
+        self.rects.append(sprite.rect)
+        sprite.store = self
+        sprite.slot = slot
+        self.count += 1
+
+    def remove(self, sprite):
+        # swap the last entity into the freed slot to keep the arrays dense
+        slot, last = sprite.slot, self.count - 1
+        moved = self.sprites[last]
+        for array in (self.pos, self.vel, self.rotation, self.rotation_speed, self.half_height):
+            array[slot] = array[last]
+        self.sprites[slot] = moved
+        self.rects[slot] = moved.rect
+        moved.slot = slot
+        self.sprites.pop()
+        self.rects.pop()
+        sprite.store = None
+        sprite.slot = None
+        self.count -= 1
+
+    def step(self, dt, margin=128):
+        count = self.count
+        if not count:
+            return
+        pos = self.pos[:count]
+        vel_y = self.vel[:count, 1]
+        pos += self.vel[:count] * dt
+        self.rotation[:count] += self.rotation_speed[:count] * dt
+
+        top = pos[:, 1] - self.half_height[:count]
+        bottom = pos[:, 1] + self.half_height[:count]
+        gone = ((vel_y < 0) & (bottom < 0)) | ((vel_y > 0) & (top > WINDOW_HEIGHT))
+        near = ~gone & (bottom >= -margin) & (top <= WINDOW_HEIGHT + margin)
+
+        sprites = self.sprites
+        rotating = near & (self.rotation_speed[:count] != 0)
+        for slot, rotation in zip(np.flatnonzero(rotating).tolist(), self.rotation[:count][rotating].tolist()):
+            sprite = sprites[slot]
+            sprite.image, sprite.mask = rotation_cache.get(sprite.original_surf, rotation)
+            sprite.rect.size = sprite.image.get_size()
+            self.half_height[slot] = sprite.rect.height / 2
+        rects = self.rects
+        for slot, center in zip(np.flatnonzero(near).tolist(), pos[near].tolist()):
+            rects[slot].center = center
+
+        # walk backwards so swap-removal never moves an entity we still have to kill
+        for slot in np.flatnonzero(gone)[::-1].tolist():
+            self.sprites[slot].kill()
+
+class PooledSprite(GameSprite):
+    pool = None
+
+    def kill(self):
+        was_alive = self.alive()
+        super().kill()
+        if was_alive and self.pool:
+            self.pool.release(self)
+
+class SpritePool:
+    def __init__(self, sprite_type, cap=256):
+        self.sprite_type = sprite_type
+        self.cap = cap
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def spawn(self, *args):
+        *args, groups = args
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(*args)
+            sprite.add(groups)
+            self.reused += 1
+        else:
+            sprite = self.sprite_type(*args, groups)
+            sprite.pool = self
+            self.created += 1
+        return sprite
+
+    def release(self, sprite):
+        if len(self.free) < self.cap:
+            self.free.append(sprite)
+
+    def stats(self):
+        return {'free': len(self.free), 'created': self.created, 'reused': self.reused, 'cap': self.cap}
+
+    def hit_rate(self):
+        total = self.created + self.reused
+        return self.reused / total if total else 0.0
+
+class Player(GameSprite):
+    _layer = LAYER_PLAYER
+
     def __init__(self, groups):
         super().__init__(groups)
-        self.image = pygame.image.load(join('images', 'player.png')).convert_alpha()
+        self.image = assets.image('player.png')
         self.rect = self.image.get_rect(center=(WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2))
         self.direction = pygame.Vector2()
         self.base_speed = 300
@@ -75,49 +343,48 @@ class Player(pygame.sprite.Sprite):
         self.invincible = False
         self.rapid_fire = False
         self.speed_boosted = False
-        self.power_up_end_time = {
-            PowerUpType.INVINCIBILITY: 0,
-            PowerUpType.RAPID_FIRE: 0,
-            PowerUpType.SPEED_BOOST: 0
-        }
-        self.original_cooldown = 400
-        self.rapid_fire_cooldown = 200
+        self.power_up_timers = {}
+        self.original_cooldown = 0.4
+        self.rapid_fire_cooldown = 0.2
 
         self.can_shoot = True
-        self.laser_shoot_time = 0
         self.cooldown_duration = self.original_cooldown
 
         self.angle = 0
         self.hover_offset = 0
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = assets.mask('player.png')
+        self.radius = assets.radius('player.png')
 
     def apply_power_up(self, power_up_type):
         duration = 5
         if power_up_type == PowerUpType.INVINCIBILITY:
             self.invincible = True
-            self.power_up_end_time[PowerUpType.INVINCIBILITY] = time.time() + duration
         elif power_up_type == PowerUpType.RAPID_FIRE:
             self.rapid_fire = True
             self.cooldown_duration = self.rapid_fire_cooldown
-            self.power_up_end_time[PowerUpType.RAPID_FIRE] = time.time() + duration
         elif power_up_type == PowerUpType.SPEED_BOOST:
             self.speed_boosted = True
             self.speed = self.base_speed * 2
-            self.power_up_end_time[PowerUpType.SPEED_BOOST] = time.time() + duration
+        # picking the same power-up again restarts its duration
+        game_clock.cancel(self.power_up_timers.get(power_up_type))
+        self.power_up_timers[power_up_type] = game_clock.schedule(duration, self.end_power_up, power_up_type)
 
-    def update_power_ups(self):
-        current_time = time.time()
-        if self.invincible and current_time > self.power_up_end_time[PowerUpType.INVINCIBILITY]:
+    def end_power_up(self, power_up_type):
+        del self.power_up_timers[power_up_type]
+        if power_up_type == PowerUpType.INVINCIBILITY:
             self.invincible = False
-        if self.rapid_fire and current_time > self.power_up_end_time[PowerUpType.RAPID_FIRE]:
+        elif power_up_type == PowerUpType.RAPID_FIRE:
             self.rapid_fire = False
             self.cooldown_duration = self.original_cooldown
-        if self.speed_boosted and current_time > self.power_up_end_time[PowerUpType.SPEED_BOOST]:
+        elif power_up_type == PowerUpType.SPEED_BOOST:
             self.speed_boosted = False
             self.speed = self.base_speed
 
+    def reload(self):
+        self.can_shoot = True
+
     def animate_menu(self, dt):
-        self.hover_offset = math.sin(time.time() * 5) * 10
+        self.hover_offset = math.sin(game_clock.time * 5) * 10
         self.rect.centery = WINDOW_HEIGHT // 2 + self.hover_offset
         self.angle += 30 * dt
         self.image = pygame.transform.rotozoom(self.original_image, math.sin(self.angle * 0.5) * 5, 1)
@@ -128,9 +395,8 @@ class Player(pygame.sprite.Sprite):
             self.image = pygame.Surface((0, 0), pygame.SRCALPHA)
             return
 
-        self.update_power_ups()
         if self.invincible:
-            if int(time.time() * 10) % 2:
+            if int(game_clock.time * 10) % 2:
                 self.image = self.original_image
             else:
                 self.image = pygame.Surface((0, 0), pygame.SRCALPHA)
@@ -138,9 +404,9 @@ class Player(pygame.sprite.Sprite):
             self.image = self.original_image
 
         if game_state == GameState.PLAYING:
-            keys = pygame.key.get_pressed()
-            self.direction.x = int(keys[pygame.K_RIGHT]) - int(keys[pygame.K_LEFT])
-            self.direction.y = int(keys[pygame.K_DOWN]) - int(keys[pygame.K_UP])
+            controls = current_controls
+            self.direction.x = bool(controls & CONTROL_RIGHT) - bool(controls & CONTROL_LEFT)
+            self.direction.y = bool(controls & CONTROL_DOWN) - bool(controls & CONTROL_UP)
             if self.direction.length() > 0:
                 self.direction = self.direction.normalize()
 
@@ -151,131 +417,239 @@ class Player(pygame.sprite.Sprite):
             new_y = max(self.rect.height // 2, min(WINDOW_HEIGHT - self.rect.height // 2, new_y))
 
             self.rect.center = (new_x, new_y)
+            engine_trail(self.rect.midbottom, dt, 90, math.pi / 2)
 
-            if keys[pygame.K_SPACE] and self.can_shoot:
-                Laser(laser_surf, self.rect.midtop, (all_sprites, laser_sprites))
+            if controls & CONTROL_SHOOT and self.can_shoot:
+                laser_pool.spawn(laser_surf, self.rect.midtop, (all_sprites, laser_sprites))
                 self.can_shoot = False
-                self.laser_shoot_time = pygame.time.get_ticks()
-                laser_sound.play()
-
-            if not self.can_shoot:
-                current_time = pygame.time.get_ticks()
-                if current_time - self.laser_shoot_time >= self.cooldown_duration:
-                    self.can_shoot = True
+                game_clock.schedule(self.cooldown_duration, self.reload)
+                sounds.play('player_laser')
 
         elif game_state == GameState.MENU:
             self.animate_menu(dt)
 
-class Star(pygame.sprite.Sprite):
-    def __init__(self, groups, surf):
-        super().__init__(groups)
-        self.image = surf
-        self.rect = self.image.get_rect(center=(randint(0, WINDOW_WIDTH), randint(0, WINDOW_HEIGHT)))
+class Starfield:
+    def __init__(self, size, star_surf, layers=STAR_LAYERS, seed=0, render_scale=1.0):
+        width, height = size
+        layout_rng = random.Random(seed)
+        self.height = height
+        self.tiles = []
+        self.speeds = []
+        self.offsets = []
+        for depth, (count, speed, scale, alpha) in enumerate(layers):
+            star = pygame.transform.smoothscale_by(star_surf, scale * render_scale)
+            star.set_alpha(alpha)
+            star_width, star_height = star.get_size()
+            blits = []
+            for i in range(count):
+                x = layout_rng.randint(-star_width // 2, width - star_width // 2)
+                pos = (x, layout_rng.randint(0, height - 1))
+                blits.append((star, pos))
+                # stars crossing the bottom edge continue at the top so the seam never shows
+                if pos[1] + star_height > height:
+                    blits.append((star, (pos[0], pos[1] - height)))
+
+            tile = pygame.Surface(size)
+            tile.fill(BACKGROUND_COLOR)
+            tile.fblits(blits)
+            if depth:
+                # nearer layers only keep their stars, run-length encoded so blits skip the empty space
+                tile.set_colorkey(BACKGROUND_COLOR, pygame.RLEACCEL)
+            self.tiles.append(tile.convert())
+            self.speeds.append(speed * render_scale)
+            self.offsets.append(0.0)
+
+    def update(self, dt):
+        for i, speed in enumerate(self.speeds):
+            self.offsets[i] = (self.offsets[i] + speed * dt) % self.height
+
+    def draw(self, surface):
+        for tile, offset in zip(self.tiles, self.offsets):
+            y = int(offset)
+            surface.blit(tile, (0, y))
+            surface.blit(tile, (0, y - self.height))
+
+class Laser(PooledSprite, BatchedSprite):
+    _layer = LAYER_LASER
 
-class Laser(pygame.sprite.Sprite):
     def __init__(self, surf, pos, groups):
         super().__init__(groups)
-        self.image = surf
-        self.rect = self.image.get_rect(midbottom=pos)
+        self.rect = pygame.Rect(0, 0, 0, 0)
         self.speed = 400
+        self.reset(surf, pos)
+
+    def reset(self, surf, pos):
+        self.image = surf
+        self.rect.size = surf.get_size()
+        self.rect.midbottom = pos
+        if entity_store:
+            entity_store.add(self, (0, -self.speed))
 
     def update(self, dt):
+        if self.store:
+            return
         self.rect.centery -= self.speed * dt
         if self.rect.bottom < 0:
             self.kill()
 
-class EnemyLaser(pygame.sprite.Sprite):
+class EnemyLaser(PooledSprite, BatchedSprite):
+    _layer = LAYER_LASER
+
     def __init__(self, surf, pos, groups):
         super().__init__(groups)
-        self.image = surf
-        self.image = pygame.transform.rotate(self.image, 180)
-        self.rect = self.image.get_rect(midtop=pos)
+        self.rect = pygame.Rect(0, 0, 0, 0)
         self.speed = 400
+        self.reset(surf, pos)
+
+    def reset(self, surf, pos):
+        self.image = surf
+        self.mask = assets.mask('enemylaser.png', 180)
+        self.radius = assets.radius('enemylaser.png', 180)
+        self.rect.size = surf.get_size()
+        self.rect.midtop = pos
+        if entity_store:
+            entity_store.add(self, (0, self.speed))
 
     def update(self, dt):
+        if self.store:
+            return
         self.rect.centery += self.speed * dt
         if self.rect.top > WINDOW_HEIGHT:
             self.kill()
 
-class Meteor(pygame.sprite.Sprite):
-    def __init__(self, surf, pos, groups):
+class RotationCache:
+    def __init__(self, steps=72, max_bytes=16 * 1024 * 1024):
+        self.steps = steps
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.atlas = {}
+        self.radii = {}
+
+    def prerender(self, surf):
+        if surf in self.atlas:
+            return self.atlas[surf]
+
+        # worst case footprint is the 45 degree bounding box, image plus 1 bit mask
+        side = math.ceil((surf.get_width() + surf.get_height()) * 0.7072)
+        step_bytes = side * side * surf.get_bytesize() + side * side // 8
+        budget = (self.max_bytes - self.used_bytes) // step_bytes
+        steps = min(self.steps, budget)
+        if steps < 1:
+            # over the cap this surface is rotated on every get instead; two pixels more cover the smoothing
+            self.radii[surf] = mask_radius(pygame.mask.from_surface(surf)) + 2
+            return None
+
+        frames = []
+        for i in range(steps):
+            image = pygame.transform.rotozoom(surf, i * 360 / steps, 1)
+            mask = pygame.mask.from_surface(image)
+            frames.append((image, mask))
+            width, height = image.get_size()
+            self.used_bytes += width * height * image.get_bytesize() + (width * height + 7) // 8
+        self.atlas[surf] = frames
+        # smoothing and odd sizes shift the rotated pixels a little, so bound every step
+        self.radii[surf] = max(mask_radius(mask) for image, mask in frames)
+        return frames
+
+    def get(self, surf, angle):
+        frames = self.atlas.get(surf)
+        if frames is None and surf not in self.radii:
+            frames = self.prerender(surf)
+        if frames is None:
+            step = 360 / self.steps
+            image = pygame.transform.rotozoom(surf, round(angle / step) % self.steps * step, 1)
+            return image, pygame.mask.from_surface(image)
+        return frames[round(angle * len(frames) / 360) % len(frames)]
+
+    def radius(self, surf):
+        if surf not in self.radii:
+            self.prerender(surf)
+        return self.radii[surf]
+
+class Meteor(BatchedSprite):
+    _layer = LAYER_METEOR
+
+    def __init__(self, surf, pos, groups, rng=random):
         super().__init__(groups)
         self.original_surf = surf
-        self.image = surf
+        self.image, self.mask = rotation_cache.get(surf, 0)
+        self.radius = rotation_cache.radius(surf)
         self.rect = self.image.get_rect(center=pos)
-        self.direction = pygame.Vector2(uniform(-0.5, 0.5), 1)
-        self.speed = randint(400, 500)
-        self.rotation_speed = randint(40, 80)
+        self.direction = pygame.Vector2(rng.uniform(-0.5, 0.5), 1)
+        self.speed = rng.randint(400, 500)
+        self.rotation_speed = rng.randint(40, 80)
         self.rotation = 0
-        self.mask = pygame.mask.from_surface(self.image)
+        if entity_store:
+            entity_store.add(self, self.direction * self.speed, self.rotation_speed)
 
     def update(self, dt):
+        if self.store:
+            return
         self.rect.center += self.direction * self.speed * dt
         self.rotation += self.rotation_speed * dt
-        self.image = pygame.transform.rotozoom(self.original_surf, self.rotation, 1)
+        self.image, self.mask = rotation_cache.get(self.original_surf, self.rotation)
         self.rect = self.image.get_rect(center=self.rect.center)
-        self.mask = pygame.mask.from_surface(self.image)
         
         if self.rect.top > WINDOW_HEIGHT:
             self.kill()
 
-class EnemyShip(pygame.sprite.Sprite):
-    def __init__(self, groups):
+class EnemyShip(GameSprite):
+    _layer = LAYER_ENEMY
+
+    def __init__(self, groups, rng=random, pos=None, direction=None):
         super().__init__(groups)
-        self.image = pygame.image.load(join('images', 'enemy.png')).convert_alpha()
-        self.image = pygame.transform.rotate(self.image, 180)
-        self.rect = self.image.get_rect(center=(randint(100, WINDOW_WIDTH - 100), -50))
+        self.image = assets.image('enemy.png', 180)
+        if pos is None:
+            pos = (rng.randint(100, WINDOW_WIDTH - 100), -50)
+        self.rect = self.image.get_rect(center=pos)
         self.speed = 150
-        self.direction = pygame.Vector2(uniform(-0.5, 0.5), 1)
-        self.direction = self.direction.normalize()
-        self.mask = pygame.mask.from_surface(self.image)
+        if direction is None:
+            direction = (rng.uniform(-0.5, 0.5), 1)
+        self.direction = pygame.Vector2(direction).normalize()
+        self.mask = assets.mask('enemy.png', 180)
+        self.radius = assets.radius('enemy.png', 180)
         
-        self.can_shoot = True
-        self.laser_shoot_time = 0
-        self.cooldown_duration = 2000
+        self.cooldown_duration = 2
         self.health = 2
+        # the first shot goes on the next tick, then one every cooldown
+        self.shoot_timer = game_clock.schedule(0, self.shoot)
 
     def take_damage(self, amount):
         self.health -= amount
         if self.health <= 0:
-            AnimatedExplosion(explosion_frames, self.rect.center, all_sprites)
+            explosion_pool.spawn(explosion_frames, self.rect.center, all_sprites)
             self.kill()
+            game_clock.cancel(self.shoot_timer)
             return True
         return False
 
     def shoot(self):
-        if self.can_shoot:
-            EnemyLaser(enemylaser_surf, self.rect.midbottom, (all_sprites, enemy_laser_sprites))
-            self.can_shoot = False
-            self.laser_shoot_time = pygame.time.get_ticks()
-            laser_sound.play()
+        if not self.alive() or game_state != GameState.PLAYING:
+            return
+        enemy_laser_pool.spawn(enemylaser_surf, self.rect.midbottom, (all_sprites, enemy_laser_sprites))
+        sounds.play('enemy_laser')
+        self.shoot_timer = game_clock.schedule(self.cooldown_duration, self.shoot)
 
     def update(self, dt):
         if game_state == GameState.PLAYING:
             self.rect.center += self.direction * self.speed * dt
+            engine_trail(self.rect.midtop, dt, 40, -math.pi / 2)
             
             if self.rect.left < 0 or self.rect.right > WINDOW_WIDTH:
                 self.direction.x *= -1
             
             if self.rect.top > WINDOW_HEIGHT:
                 self.kill()
-            
-            current_time = pygame.time.get_ticks()
-            if current_time - self.laser_shoot_time >= self.cooldown_duration:
-                self.can_shoot = True
-                self.shoot()
 
-class PowerUp(pygame.sprite.Sprite):
+class PowerUp(GameSprite):
+    _layer = LAYER_POWER_UP
+
     def __init__(self, pos, power_type, groups):
         super().__init__(groups)
         self.type = power_type
-        
-        if power_type == PowerUpType.SPEED_BOOST:
-            self.frames = get_frames(speed_boost_sheet)
-        elif power_type == PowerUpType.RAPID_FIRE:
-            self.frames = get_frames(rapid_fire_sheet)
-        elif power_type == PowerUpType.INVINCIBILITY:
-            self.frames = get_frames(invincibility_sheet)
+        self.frames = assets.frames(POWER_UP_SHEETS[power_type])
+        self.masks = assets.frame_masks(POWER_UP_SHEETS[power_type])
+        self.radius = assets.frames_radius(POWER_UP_SHEETS[power_type])
         
         self.frame_index = 0
         self.animation_speed = 10
@@ -283,14 +657,14 @@ class PowerUp(pygame.sprite.Sprite):
         self.rect = self.image.get_rect(center=pos)
         
         self.speed = 200
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = self.masks[self.frame_index]
     
     def animate(self, dt):
         self.frame_index += self.animation_speed * dt
         if self.frame_index >= len(self.frames):
             self.frame_index = 0
         self.image = self.frames[int(self.frame_index)]
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = self.masks[int(self.frame_index)]
     
     def update(self, dt):
         self.rect.y += self.speed * dt
@@ -298,14 +672,21 @@ class PowerUp(pygame.sprite.Sprite):
         if self.rect.top > WINDOW_HEIGHT:
             self.kill()
 
-class AnimatedExplosion(pygame.sprite.Sprite):
+class AnimatedExplosion(PooledSprite):
+    _layer = LAYER_EFFECT
+
     def __init__(self, frames, pos, groups):
         super().__init__(groups)
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.reset(frames, pos)
+
+    def reset(self, frames, pos):
         self.frames = frames
         self.frame_index = 0
         self.image = self.frames[self.frame_index]
-        self.rect = self.image.get_rect(center=pos)
-        explosion_sound.play()
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+        sounds.play('explosion')
 
     def update(self, dt):
         self.frame_index += 20 * dt
@@ -314,32 +695,6 @@ class AnimatedExplosion(pygame.sprite.Sprite):
         else:
             self.kill()
 
-class AnimatedText:
-    def __init__(self, text, font, color, pos, size, animation_type):
-
-        self.font = pygame.font.Font(font, size)
-        self.text = text
-        self.color = color
-        self.pos = pos
-        self.scale = 1.0
-        self.growing = True
-        
-    def update(self, dt):
-        if self.growing:
-            self.scale += dt
-            if self.scale >= 1.1:
-                self.growing = False
-        else:
-            self.scale -= dt
-            if self.scale <= 0.9:
-                self.growing = True
-                
-    def draw(self, surface):
-        text_surface = self.font.render(self.text, True, self.color)
-        scaled_surface = pygame.transform.rotozoom(text_surface, 0, self.scale)
-        rect = scaled_surface.get_rect(center=self.pos)
-        surface.blit(scaled_surface, rect)
-
 def get_frames(sprite_sheet, frame_count=4, scale=2):
     frame_width = sprite_sheet.get_width() // frame_count
     frame_height = sprite_sheet.get_height()
@@ -353,21 +708,297 @@ def get_frames(sprite_sheet, frame_count=4, scale=2):
     
     return frames
 
+def mask_radius(mask):
+    # farthest opaque pixel corner from the image centre; the farthest pixel always lies on an outline
+    width, height = mask.get_size()
+    radius = 0
+    for component in mask.connected_components():
+        for x, y in component.outline():
+            radius = max(radius, math.hypot(x + 0.5 - width / 2, y + 0.5 - height / 2))
+    # half a pixel diagonal, plus a pixel of slack for integer rect centres
+    return radius + 1.71
+
+def asset_size(asset):
+    if isinstance(asset, pygame.Surface):
+        return asset.get_width() * asset.get_height() * asset.get_bytesize()
+    if isinstance(asset, pygame.mask.Mask):
+        width, height = asset.get_size()
+        return width * height // 8
+    if isinstance(asset, pygame.mixer.Sound):
+        frequency, size, channels = pygame.mixer.get_init()
+        return int(asset.get_length() * frequency * channels * abs(size) // 8)
+    if isinstance(asset, list):
+        return sum(asset_size(item) for item in asset)
+    return 0
+
+class AssetManager:
+    def __init__(self):
+        self.cache = {}
+        self.stats = {}
+        self.atlas = None
+
+    def load(self, key, loader):
+        if key not in self.cache:
+            start = time.perf_counter()
+            asset = loader()
+            self.stats[key] = (time.perf_counter() - start, asset_size(asset))
+            self.cache[key] = asset
+        return self.cache[key]
+
+    def load_bundle(self, path):
+        start = time.perf_counter()
+        with open(path, 'rb') as file:
+            data = file.read()
+        if data[:4] != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not an asset bundle")
+        header_size = int.from_bytes(data[4:8], 'little')
+        header = json.loads(data[8:8 + header_size])
+        pixels = memoryview(data)[8 + header_size:]
+        if header['compression'] == 'zlib':
+            pixels = zlib.decompress(pixels)
+
+        atlas = pygame.image.frombuffer(pixels, header['size'], 'RGBA').convert_alpha()
+        for key, regions in header['entries']:
+            if key[0] == 'image':
+                asset = atlas.subsurface(regions)
+            else:
+                asset = [atlas.subsurface(region) for region in regions]
+            # subsurfaces share the atlas pixels, which are accounted to the bundle itself
+            self.cache[tuple(key)] = asset
+            self.stats[tuple(key)] = (0, 0)
+        self.stats[('bundle', path)] = (time.perf_counter() - start, asset_size(atlas))
+        self.atlas = atlas
+
+    def image(self, name, angle=0):
+        if angle:
+            return self.load(('image', name, angle),
+                             lambda: pygame.transform.rotate(self.image(name), angle))
+        return self.load(('image', name, 0),
+                         lambda: pygame.image.load(join('images', name)).convert_alpha())
+
+    def mask(self, name, angle=0):
+        return self.load(('mask', name, angle), lambda: pygame.mask.from_surface(self.image(name, angle)))
+
+    def radius(self, name, angle=0):
+        return self.load(('radius', name, angle), lambda: mask_radius(self.mask(name, angle)))
+
+    def frames(self, name, frame_count=4, scale=2):
+        return self.load(('frames', name, frame_count, scale),
+                         lambda: get_frames(self.image(name), frame_count, scale))
+
+    def frame_masks(self, name, frame_count=4, scale=2):
+        return self.load(('frame_masks', name, frame_count, scale),
+                         lambda: [pygame.mask.from_surface(frame) for frame in self.frames(name, frame_count, scale)])
+
+    def frames_radius(self, name, frame_count=4, scale=2):
+        return self.load(('frames_radius', name, frame_count, scale),
+                         lambda: max(mask_radius(mask) for mask in self.frame_masks(name, frame_count, scale)))
+
+    def sequence(self, folder, count):
+        return self.load(('sequence', folder, count),
+                         lambda: [self.image(join(folder, f'{i}.png')) for i in range(count)])
+
+    def sound(self, name, volume=1.0):
+        if not pygame.mixer.get_init():
+            return SilentSound()
+
+        def loader():
+            sound = pygame.mixer.Sound(join('audio', name))
+            sound.set_volume(volume)
+            return sound
+        # set_volume changes the shared Sound, so each volume is its own entry
+        return self.load(('sound', name, volume), loader)
+
+    def totals(self):
+        # sequences only hold references to images that are already listed
+        owned = [stat for key, stat in self.stats.items() if key[0] != 'sequence']
+        return sum(load_time for load_time, _ in owned), sum(size for _, size in owned)
+
+    def report(self):
+        lines = []
+        for key, (load_time, size) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            name = ' '.join(str(part) for part in key)
+            lines.append(f"{name:<48} {load_time * 1000:8.2f} ms {size / 1024:10.1f} KiB")
+        total_time, total_size = self.totals()
+        lines.append(f"{'total':<48} {total_time * 1000:8.2f} ms {total_size / 1024:10.1f} KiB")
+        return '\n'.join(lines)
+
 def display_score(surface, score):
-    text_surf = font.render(f"Score: {score}", True, (240, 240, 240))
-    text_rect = text_surf.get_rect(midbottom=(WINDOW_WIDTH / 2, WINDOW_HEIGHT - 50))
+    s = render_scale
+    text_surf = text_cache.render(font, f"Score: {score}", (240, 240, 240), s)
+    text_rect = text_surf.get_rect(midbottom=scale_point((WINDOW_WIDTH / 2, WINDOW_HEIGHT - 50)))
     surface.blit(text_surf, text_rect)
-    pygame.draw.rect(surface, (240, 240, 240), text_rect.inflate(20, 10).move(0, -8), 5, 10)
+    box_rect = text_rect.inflate(round(20 * s), round(10 * s)).move(0, round(-8 * s))
+    pygame.draw.rect(surface, (240, 240, 240), box_rect, max(1, round(5 * s)), round(10 * s))
+    return text_rect.union(box_rect)
+
+class DirtyRenderer:
+    def __init__(self, surface, starfield):
+        self.surface = surface
+        # repainting the starfield means repainting the whole screen, so it only moves when the far layer
+        # crosses a whole pixel, a few times a second, and the nearer layers move in larger steps with it
+        self.starfield = starfield
+        self.star_offset = int(starfield.offsets[0])
+        self.clean_background = pygame.Surface(surface.get_size()).convert()
+        starfield.draw(self.clean_background)
+        # the score lives in the background so sprites pass over it like in the full redraw
+        self.background = self.clean_background.copy()
+        self.score = None
+        self.score_rect = pygame.Rect(0, 0, 0, 0)
+        self.sprites = pygame.sprite.LayeredDirty()
+        self.sprites.clear(surface, self.background)
+
+    def draw_background(self, surface):
+        surface.blit(self.clean_background, (0, 0))
+
+    def draw_sprites(self, surface):
+        for sprite in self.sprites:
+            if sprite.visible:
+                surface.blit(sprite.image, sprite.rect)
+
+    def repaint(self):
+        self.score = None
+        self.sprites.repaint_rect(self.surface.get_rect())
+
+    def draw(self, score):
+        star_offset = int(self.starfield.offsets[0])
+        if star_offset != self.star_offset:
+            self.star_offset = star_offset
+            self.starfield.draw(self.clean_background)
+            self.background.blit(self.clean_background, (0, 0))
+            self.repaint()
+        if score != self.score:
+            self.background.blit(self.clean_background, self.score_rect, self.score_rect)
+            score_rect = display_score(self.background, score)
+            self.sprites.repaint_rect(self.score_rect.union(score_rect))
+            self.score = score
+            self.score_rect = score_rect
+        return self.sprites.draw(self.surface)
+
+class BatchRenderer:
+    def __init__(self, trials=64, repeats=5):
+        self.trials = trials
+        self.repeats = repeats
+        self.variants = {}
+        self.choices = {}
+        self.families = {}
+        self.scale = 1.0
+        # images outside the prepared families, scaled on first use and dropped along with the image
+        self.scaled = weakref.WeakKeyDictionary()
+        self.scratch = pygame.Surface((256, 256)).convert()
+
+    def prepare(self, name, surfaces):
+        if not surfaces:
+            return
+        self.families[name] = surfaces
+        scaled = [self.resize(surf) for surf in surfaces]
+        # time each variant on the actual images and keep the fastest for the whole family
+        candidates = {
+            'plain': [(surf, 0) for surf in scaled],
+            'rle': [(self.rle(surf), 0) for surf in scaled],
+            'premultiplied': [(surf.premul_alpha(), pygame.BLEND_PREMULTIPLIED) for surf in scaled]
+        }
+        runs = {}
+        for kind, variants in candidates.items():
+            flags = variants[0][1]
+            blits = [(variants[i % len(variants)][0], (0, 0)) for i in range(self.trials)]
+            self.scratch.fblits(blits, flags)
+            runs[kind] = (blits, flags)
+        # take each variant's best of several rounds, taking turns so a slow moment hits them all alike
+        timings = dict.fromkeys(runs, float('inf'))
+        for repeat in range(self.repeats):
+            for kind, (blits, flags) in runs.items():
+                start = time.perf_counter()
+                self.scratch.fblits(blits, flags)
+                timings[kind] = min(timings[kind], time.perf_counter() - start)
+        choice = min(timings, key=timings.get)
+        self.choices[name] = choice
+        for surf, variant in zip(surfaces, candidates[choice]):
+            self.variants[surf] = variant
+
+    def rle(self, surf):
+        surf = surf.copy()
+        surf.set_alpha(255, pygame.RLEACCEL)
+        return surf
+
+    def resize(self, surf):
+        if self.scale == 1:
+            return surf
+        return pygame.transform.smoothscale_by(surf, self.scale)
+
+    def set_scale(self, scale):
+        self.scale = scale
+        self.variants = {}
+        self.scaled = weakref.WeakKeyDictionary()
+        for name, surfaces in self.families.items():
+            self.prepare(name, surfaces)
+
+    def draw(self, surface, sprites):
+        variants = self.variants
+        batches = {}
+        if self.scale == 1:
+            for sprite in sprites:
+                image = sprite.image
+                variant, flags = variants.get(image) or (image, 0)
+                batches.setdefault((sprite._layer, flags), []).append((id(image), variant, sprite.rect))
+        else:
+            scale = self.scale
+            scaled = self.scaled
+            for sprite in sprites:
+                image = sprite.image
+                variant, flags = variants.get(image) or (None, 0)
+                if variant is None:
+                    variant = scaled.get(image)
+                    if variant is None:
+                        variant = scaled[image] = self.resize(image)
+                rect = sprite.rect
+                pos = (rect.x * scale, rect.y * scale)
+                batches.setdefault((sprite._layer, flags), []).append((id(image), variant, pos))
+        # layers keep their order, and inside a layer equal textures go out back to back
+        for layer, flags in sorted(batches):
+            batch = batches[layer, flags]
+            batch.sort(key=itemgetter(0))
+            surface.fblits([(variant, rect) for texture, variant, rect in batch], flags)
+
+def draw_background(surface):
+    with profiler.section('background'):
+        if DIRTY_RENDERING:
+            renderer.draw_background(surface)
+        else:
+            starfield.draw(surface)
+
+def draw_sprites(surface):
+    if DIRTY_RENDERING:
+        renderer.draw_sprites(surface)
+    elif BATCHED_RENDERING or render_scale != 1:
+        batch_renderer.draw(surface, all_sprites)
+    else:
+        all_sprites.draw(surface)
+    draw_particles(surface)
+
+def draw_particles(surface):
+    if particles:
+        particles.draw(surface)
 
 def draw_menu(surface):
-    surface.fill('#3a2e3f')
+    draw_background(surface)
     title_text.draw(surface)
-    start_text.draw(surface)
+    if asset_loader.finished():
+        start_text.draw(surface)
+    else:
+        draw_progress(surface, asset_loader.progress())
     for instruction in menu_instructions:
         instruction.draw(surface)
-    all_sprites.draw(surface)
+    draw_sprites(surface)
     version_text.draw(surface)
 
+def draw_progress(surface, progress):
+    rect = pygame.Rect(0, 0, 400 * render_scale, 16 * render_scale)
+    rect.center = scale_point(start_text.pos)
+    width = max(1, round(2 * render_scale))
+    surface.fill((200, 200, 200), (rect.x, rect.y, rect.width * progress, rect.height))
+    pygame.draw.rect(surface, (240, 240, 240), rect.inflate(width * 4, width * 4), width)
+
 def init_menu_text():
     global title_text, start_text, menu_instructions, version_text
     
@@ -422,32 +1053,47 @@ def init_menu_text():
     )
 
 def draw_game_over(surface):
-    surface.fill('#3a2e3f')
+    draw_background(surface)
     game_over_text.draw(surface)
-    final_score_text = font.render(f"Final Score: {final_score}", True, (240, 240, 240))
-    final_score_rect = final_score_text.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2))
+    final_score_text = text_cache.render(font, f"Final Score: {final_score}", (240, 240, 240), render_scale)
+    final_score_rect = final_score_text.get_rect(center=scale_point((WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2)))
     surface.blit(final_score_text, final_score_rect)
     restart_text.draw(surface)
-    all_sprites.draw(surface)
+    draw_sprites(surface)
 
-def reset_game():
+def update_sprites(dt):
+    starfield.update(dt)
+    if particles:
+        particles.update(dt)
+    if entity_store:
+        entity_store.step(dt)
+    all_sprites.update(dt)
+
+def create_groups():
     global all_sprites, meteor_sprites, laser_sprites, enemy_sprites, enemy_laser_sprites
-    global power_up_sprites, player, final_score, score, game_state
-    
-    all_sprites = pygame.sprite.Group()
+    global power_up_sprites, renderer
+
+    if DIRTY_RENDERING:
+        renderer = DirtyRenderer(display_surface, starfield)
+        all_sprites = renderer.sprites
+    else:
+        all_sprites = pygame.sprite.Group()
     meteor_sprites = pygame.sprite.Group()
     laser_sprites = pygame.sprite.Group()
     enemy_sprites = pygame.sprite.Group()
     enemy_laser_sprites = pygame.sprite.Group()
     power_up_sprites = pygame.sprite.Group()
+
+def reset_game():
+    global player, final_score, score, wave_scheduler
     
-    for i in range(20):
-        Star(all_sprites, star_surf)
+    create_groups()
+    game_clock.clear()
+    wave_scheduler = WaveScheduler(waves, game_clock, rng, spawn_config['difficulty'], spawn_config['spawns_per_tick'])
     player = Player(all_sprites)
     player.visible = True
     final_score = 0
     score = 0
-    game_state = GameState.PLAYING
     return True
 
 def game_over():
@@ -456,164 +1102,1090 @@ def game_over():
     final_score = score
     game_state = GameState.GAME_OVER
 
+class SpatialHash:
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.order = {}
+
+    def rebuild(self, *groups):
+        self.cells.clear()
+        self.order.clear()
+        for group in groups:
+            for sprite in group:
+                self.insert(sprite)
+
+    def insert(self, sprite):
+        self.order[sprite] = len(self.order)
+        rect = sprite.rect
+        size = self.cell_size
+        for x in range(rect.left // size, rect.right // size + 1):
+            for y in range(rect.top // size, rect.bottom // size + 1):
+                self.cells.setdefault((x, y), []).append(sprite)
+
+    def query(self, rect):
+        size = self.cell_size
+        found = set()
+        for x in range(rect.left // size, rect.right // size + 1):
+            for y in range(rect.top // size, rect.bottom // size + 1):
+                found.update(self.cells.get((x, y), ()))
+        # keep group order so hits come back in the same order as spritecollide
+        return sorted(found, key=self.order.__getitem__)
+
+    def spritecollide(self, sprite, group, dokill, collided=None):
+        hits = []
+        for other in self.query(sprite.rect):
+            if not group.has(other):
+                continue
+            if collided(sprite, other) if collided else sprite.rect.colliderect(other.rect):
+                hits.append(other)
+        if dokill:
+            for other in hits:
+                other.kill()
+        return hits
+
+def spark_effect(pos):
+    if particles:
+        particles.emit('spark', 16, pos, (120, 380), (0.2, 0.45))
+    else:
+        explosion_pool.spawn(explosion_frames, pos, all_sprites)
+
+def debris_effect(meteor):
+    if particles:
+        velocity = meteor.direction * meteor.speed * 0.3
+        particles.emit('debris', 20, meteor.rect.center, (40, 200), (0.5, 1.1), velocity=velocity)
+
+def engine_trail(pos, dt, rate, angle):
+    if particles:
+        particles.emit_rate('trail', rate, dt, pos, (60, 140), (0.15, 0.3), angle=angle, spread=0.6)
+
+def collide_shapes(sprite, other):
+    # escalate from bounding circles to boxes to pixels, stopping at the first tier that rules a hit out
+    stats = collision_stats
+    stats['tests'] += 1
+    rect = sprite.rect
+    other_rect = other.rect
+    dx = rect.centerx - other_rect.centerx
+    dy = rect.centery - other_rect.centery
+    reach = sprite.radius + other.radius
+    if dx * dx + dy * dy > reach * reach:
+        stats['circle rejects'] += 1
+        return False
+    if not rect.colliderect(other_rect):
+        stats['rect rejects'] += 1
+        return False
+    stats['mask tests'] += 1
+    return sprite.mask.overlap(other.mask, (other_rect.x - rect.x, other_rect.y - rect.y)) is not None
+
 def collisions():
-    global score, game_state
+    global score, game_state, hit_count
+
+    for name in collision_stats:
+        collision_stats[name] = 0
+    spatial_hash.rebuild(meteor_sprites, enemy_sprites, enemy_laser_sprites, power_up_sprites)
 
-    power_up_hits = pygame.sprite.spritecollide(player, power_up_sprites, True, pygame.sprite.collide_mask)
+    power_up_hits = spatial_hash.spritecollide(player, power_up_sprites, True, collide_shapes)
     for power_up in power_up_hits:
         player.apply_power_up(power_up.type)
+    hit_count += len(power_up_hits)
 
     if not player.invincible:
-        if pygame.sprite.spritecollide(player, meteor_sprites, True, pygame.sprite.collide_mask):
+        if spatial_hash.spritecollide(player, meteor_sprites, True, collide_shapes):
             game_over()
 
-        if pygame.sprite.spritecollide(player, enemy_sprites, True, pygame.sprite.collide_mask):
+        if spatial_hash.spritecollide(player, enemy_sprites, True, collide_shapes):
             game_over()
 
-        if pygame.sprite.spritecollide(player, enemy_laser_sprites, True, pygame.sprite.collide_mask):
+        if spatial_hash.spritecollide(player, enemy_laser_sprites, True, collide_shapes):
             game_over()
 
     for laser in laser_sprites:
-        meteor_hits = pygame.sprite.spritecollide(laser, meteor_sprites, True)
+        meteor_hits = spatial_hash.spritecollide(laser, meteor_sprites, True)
         if meteor_hits:
+            hit_count += len(meteor_hits)
             laser.kill()
-            AnimatedExplosion(explosion_frames, laser.rect.midtop, all_sprites)
+            explosion_pool.spawn(explosion_frames, laser.rect.midtop, all_sprites)
+            for meteor in meteor_hits:
+                debris_effect(meteor)
             score += 50
 
-        enemy_hits = pygame.sprite.spritecollide(laser, enemy_sprites, False)
+        enemy_hits = spatial_hash.spritecollide(laser, enemy_sprites, False)
+        hit_count += len(enemy_hits)
         for enemy in enemy_hits:
             if enemy.take_damage(1):
                 score += 100
             laser.kill()
-            AnimatedExplosion(explosion_frames, laser.rect.midtop, all_sprites)
+            spark_effect(laser.rect.midtop)
 
     for meteor in meteor_sprites:
-        enemy_hits = pygame.sprite.spritecollide(meteor, enemy_sprites, False)
+        enemy_hits = spatial_hash.spritecollide(meteor, enemy_sprites, False)
+        hit_count += len(enemy_hits)
         for enemy in enemy_hits:
             if enemy.take_damage(1):
-                AnimatedExplosion(explosion_frames, enemy.rect.center, all_sprites)
+                explosion_pool.spawn(explosion_frames, enemy.rect.center, all_sprites)
             meteor.kill()
-            AnimatedExplosion(explosion_frames, meteor.rect.center, all_sprites)
-
-async def main():
-    global WINDOW_WIDTH, WINDOW_HEIGHT, display_surface, clock, font, font_Bold
-    global title_text, start_text, game_over_text, restart_text
-    global speed_boost_sheet, rapid_fire_sheet, invincibility_sheet
-    global star_surf, meteor_surf, laser_surf, enemylaser_surf, explosion_frames
-    global laser_sound, explosion_sound, game_music
-    global all_sprites, meteor_sprites, laser_sprites, enemy_sprites
-    global enemy_laser_sprites, power_up_sprites, player
-    global game_state, score, final_score
-
-    pygame.init()
+            explosion_pool.spawn(explosion_frames, meteor.rect.center, all_sprites)
+            debris_effect(meteor)
+
+def load_waves(path):
+    with open(path) as file:
+        waves = json.load(file)
+    validate_waves(waves, path)
+    return waves
+
+def validate_waves(waves, path):
+    def fail(where, message):
+        raise ValueError(f"{path}: {where}: {message}")
+
+    def number(value, minimum=0, strict=False):
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and (value > minimum if strict else value >= minimum))
+
+    if not isinstance(waves, dict) or not isinstance(waves.get('waves'), list) or not waves['waves']:
+        fail('top level', 'expected an object with a non-empty "waves" list')
+    difficulty = waves.get('difficulty', {})
+    if not isinstance(difficulty, dict):
+        fail('difficulty', 'expected an object')
+    for key, value in difficulty.items():
+        if key not in ('start', 'per_cycle', 'max'):
+            fail(f'difficulty.{key}', 'expected start, per_cycle or max')
+        # spawn intervals are divided by the level, so it can never reach zero
+        if not number(value, strict=key != 'per_cycle'):
+            fail(f'difficulty.{key}', 'must be a positive number' if key != 'per_cycle' else 'must be a number >= 0')
+
+    for i, wave in enumerate(waves['waves']):
+        if not isinstance(wave, dict):
+            fail(f'waves[{i}]', 'expected an object')
+        if not number(wave.get('duration'), strict=True):
+            fail(f'waves[{i}]', '"duration" must be a positive number of seconds')
+        if not isinstance(wave.get('spawns', []), list):
+            fail(f'waves[{i}]', '"spawns" must be a list')
+        for j, spawn in enumerate(wave.get('spawns', [])):
+            where = f'waves[{i}].spawns[{j}]'
+            if not isinstance(spawn, dict):
+                fail(where, 'expected an object')
+            if spawn.get('kind') not in SPAWN_KINDS:
+                fail(where, f"\"kind\" must be one of {', '.join(SPAWN_KINDS)}")
+            if not number(spawn.get('every'), strict=True):
+                fail(where, '"every" must be a positive number of seconds')
+            if not number(spawn.get('offset', 0)) or spawn.get('offset', 0) >= wave['duration']:
+                fail(where, '"offset" must lie inside the wave')
+            count = spawn.get('count', 1)
+            if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+                fail(where, '"count" must be a positive integer')
+            if spawn.get('formation', 'random') not in FORMATIONS:
+                fail(where, f"\"formation\" must be one of {', '.join(FORMATIONS)}")
+            if not number(spawn.get('spacing', 1), strict=True):
+                fail(where, '"spacing" must be a positive number of pixels')
+
+def formation(spawn, count, rng):
+    kind = spawn['kind']
+    shape = spawn.get('formation', 'random')
+    spacing = spawn.get('spacing', 90)
+    margin = {'meteor': 0, 'enemy': 100, 'power_up': 50}[kind]
+
+    if shape == 'random':
+        if kind == 'meteor':
+            return [(rng.randint(0, WINDOW_WIDTH), rng.randint(-200, -100)) for i in range(count)]
+        return [(rng.randint(margin, WINDOW_WIDTH - margin), -50) for i in range(count)]
+
+    if shape != 'column' and count > 1:
+        spacing = min(spacing, (WINDOW_WIDTH - 2 * margin) / (count - 1))
+    width = 0 if shape == 'column' else spacing * (count - 1)
+    left = rng.randint(margin, max(margin, int(WINDOW_WIDTH - margin - width)))
+    if shape == 'line':
+        return [(left + i * spacing, -100) for i in range(count)]
+    if shape == 'column':
+        return [(left, -100 - i * spacing) for i in range(count)]
+    middle = (count - 1) / 2
+    return [(left + i * spacing, -100 - abs(i - middle) * spacing * 0.6) for i in range(count)]
+
+class WaveScheduler:
+    def __init__(self, waves, clock, rng, difficulty=1.0, spawns_per_tick=4):
+        self.waves = waves['waves']
+        self.curve = waves.get('difficulty', {})
+        self.clock = clock
+        self.scale = difficulty
+        self.spawns_per_tick = spawns_per_tick
+        self.start = clock.time
+        self.queued = 0
+        self.cycle = 0
+        self.wave = 0
+        self.wave_start = 0
+        self.deferred = 0
+        self.budget_tick = None
+        self.spawned = 0
+        # a paused scheduler keeps its timeline but drops what falls due, for scenes with fixed populations
+        self.paused = False
+        self.plan_wave(rng)
+
+    def difficulty(self):
+        level = self.curve.get('start', 1.0) + self.curve.get('per_cycle', 0.0) * self.cycle
+        return min(level, self.curve.get('max', level)) * self.scale
+
+    def plan_wave(self, rng):
+        clock = self.clock
+        wave = self.waves[self.wave]
+        level = self.difficulty()
+        for spawn in wave.get('spawns', []):
+            kind = SPAWN_KINDS[spawn['kind']]
+            count = spawn.get('count', 1)
+            if count > 1:
+                count = max(1, round(count * level))
+            every = spawn['every'] / level
+            offset = spawn.get('offset', spawn['every']) / level
+            while offset < wave['duration']:
+                for pos in formation(spawn, count, rng):
+                    extra = None
+                    if kind == SPAWN_ENEMY and spawn.get('formation', 'random') != 'random':
+                        extra = (0, 1)
+                    elif kind == SPAWN_POWER_UP:
+                        extra = rng.choice(list(PowerUpType))
+                    due = self.start + self.wave_start + offset
+                    clock.schedule(due - clock.time, self.spawn, kind, pos, extra)
+                    self.queued += 1
+                offset += every
+
+        self.wave_start += wave['duration']
+        self.wave += 1
+        if self.wave == len(self.waves):
+            self.wave = 0
+            self.cycle += 1
+        # queue each wave a little before it starts so its planning never shares a tick with its spawns
+        due = self.start + self.wave_start - PLAN_AHEAD
+        clock.schedule(due - clock.time, self.plan_wave, rng)
+
+    def spawn(self, kind, pos, extra):
+        if self.paused or game_state != GameState.PLAYING:
+            # the timeline keeps running behind the game over screen, but nothing enters it
+            self.queued -= 1
+            return
+        if self.budget_tick != tick_count:
+            self.budget_tick = tick_count
+            self.spawned = 0
+        if self.spawned >= self.spawns_per_tick:
+            # a burst larger than the budget rolls over into the next ticks
+            if self.spawned == self.spawns_per_tick:
+                self.deferred += 1
+            self.spawned += 1
+            self.clock.schedule(0, self.spawn, kind, pos, extra)
+            return
+        self.queued -= 1
+        self.spawned += 1
+        SPAWNERS[kind](pos, extra)
+
+    def snapshot(self):
+        return (self.queued, self.cycle, self.wave, self.wave_start, self.deferred, self.budget_tick, self.spawned)
+
+    def restore(self, state):
+        self.queued, self.cycle, self.wave, self.wave_start, self.deferred, self.budget_tick, self.spawned = state
+
+def log_spawn(kind):
+    spawn_log.append((tick_count, kind))
+    if recorder:
+        recorder.record_spawn(tick_count, kind)
+
+def spawn_meteor(pos, extra):
+    if len(meteor_sprites) < spawn_config['meteor_cap']:
+        Meteor(meteor_surf, pos, (all_sprites, meteor_sprites), rng)
+        log_spawn(SPAWN_METEOR)
+
+def spawn_enemy(pos, direction):
+    if len(enemy_sprites) < spawn_config['enemy_cap']:
+        EnemyShip((all_sprites, enemy_sprites), rng, pos, direction)
+        log_spawn(SPAWN_ENEMY)
+
+def spawn_power_up(pos, power_type):
+    if len(power_up_sprites) < spawn_config['power_up_cap']:
+        PowerUp(pos, power_type, (all_sprites, power_up_sprites))
+        log_spawn(SPAWN_POWER_UP)
+
+SPAWNERS = {SPAWN_METEOR: spawn_meteor, SPAWN_ENEMY: spawn_enemy, SPAWN_POWER_UP: spawn_power_up}
+
+def keyboard_controls():
+    keys = pygame.key.get_pressed()
+    controls = 0
+    for key, control in CONTROL_KEYS.items():
+        if keys[key]:
+            controls |= control
+    return controls
+
+class SilentSound:
+    def play(self, *args, **kwargs):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+class SoundEffect:
+    def __init__(self, sound, max_voices, priority, channels):
+        self.sound = sound
+        self.max_voices = max_voices
+        self.priority = priority
+        self.channels = channels
+        self.voices = []
+        self.last_played = None
+
+class SoundManager:
+    def __init__(self, channels=16):
+        self.enabled = pygame.mixer.get_init() is not None
+        self.effects = {}
+        self.reserved = 0
+        self.played = 0
+        self.deduplicated = 0
+        self.stolen = 0
+        self.dropped = 0
+        self.channels = []
+        if self.enabled:
+            pygame.mixer.set_num_channels(channels)
+            self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+
+    def register(self, name, sound, max_voices=4, priority=0, reserve=0):
+        channels = []
+        if self.enabled and reserve:
+            channels = self.channels[self.reserved:self.reserved + reserve]
+            self.reserved += reserve
+            pygame.mixer.set_reserved(self.reserved)
+        self.effects[name] = SoundEffect(sound, reserve or max_voices, priority, channels)
+
+    def play_music(self, names, volume=1.0):
+        if not self.enabled:
+            return False
+        # pygame.mixer.music streams from disk instead of decoding the whole track into memory
+        for name in names:
+            path = join('audio', name)
+            if os.path.exists(path):
+                pygame.mixer.music.load(path)
+                pygame.mixer.music.set_volume(volume)
+                pygame.mixer.music.play(-1)
+                return True
+        return False
+
+    def find_channel(self):
+        # pygame.mixer.find_channel can hand out reserved channels, so scan the shared ones here
+        for channel in self.channels[self.reserved:]:
+            if not channel.get_busy():
+                return channel
+        return None
+
+    def steal(self, priority):
+        oldest = None
+        for effect in self.effects.values():
+            if effect.priority >= priority or effect.channels:
+                continue
+            for voice in effect.voices:
+                if oldest is None or voice[1] < oldest[2][1]:
+                    oldest = (effect, effect.voices.index(voice), voice)
+        if oldest is None:
+            return None
+        effect, index, voice = oldest
+        del effect.voices[index]
+        self.stolen += 1
+        return voice[0]
+
+    def play(self, name):
+        effect = self.effects[name]
+        if not self.enabled:
+            return
+        # a chain of hits in one frame only needs to be heard once
+        if effect.last_played == game_clock.time:
+            self.deduplicated += 1
+            return
+        effect.last_played = game_clock.time
+        effect.voices = [voice for voice in effect.voices if voice[0].get_sound() is effect.sound]
+
+        if len(effect.voices) >= effect.max_voices:
+            channel = effect.voices.pop(0)[0]
+        elif effect.channels:
+            channel = next((channel for channel in effect.channels if not channel.get_busy()), None)
+            if channel is None:
+                # something else holds every reserved channel, cut off the oldest of them
+                channel = effect.voices.pop(0)[0] if effect.voices else effect.channels[0]
+                self.stolen += 1
+        else:
+            channel = self.find_channel() or self.steal(effect.priority)
+        if channel is None:
+            self.dropped += 1
+            return
+
+        channel.play(effect.sound)
+        effect.voices.append((channel, game_clock.time))
+        self.played += 1
+
+def init_menu(seed=None, headless=False, bundle=BUNDLE_PATH, spawn_config=None):
+    global WINDOW_WIDTH, WINDOW_HEIGHT, display_surface, clock, font, font_Bold, text_cache
+    global assets, star_surf, starfield, render_scale, scene_surface, batch_renderer, fixed_scale
+    global rotation_cache, spatial_hash, collision_stats, particles, laser_pool, enemy_laser_pool, explosion_pool, entity_store
+    global sounds, profiler, load_start, startup_times
+
+    load_start = time.perf_counter()
+    startup_times = {}
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.display.init()
+        pygame.font.init()
+    else:
+        pygame.init()
     WINDOW_WIDTH, WINDOW_HEIGHT = 1280, 720
-    display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    # the dirty renderer redraws in window pixels, so it always runs at full size
+    fixed_scale = 1 if RENDER_SCALE == 'auto' or DIRTY_RENDERING else RENDER_SCALE
+    if fixed_scale != 1 and not headless:
+        # a fixed scale gets a window of that size, which SDL stretches on the GPU
+        size = (round(WINDOW_WIDTH * fixed_scale), round(WINDOW_HEIGHT * fixed_scale))
+        display_surface = pygame.display.set_mode(size, pygame.SCALED)
+    else:
+        display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     pygame.display.set_caption('Space shooter')
     clock = pygame.time.Clock()
 
     font = pygame.font.Font(join('fonts', 'PixelOperator8.ttf'), 40)
     font_Bold = pygame.font.Font(join('fonts', 'PixelOperator8-Bold.ttf'), 30)
-
-    title_text = AnimatedText("SPACE SHOOTER", join('fonts', 'PixelOperator8-Bold.ttf'),
-                             (240, 240, 240), (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 3), 80,
-                             'pulse')
-    
-    start_text = AnimatedText("Press ENTER to Start", join('fonts', 'PixelOperator8.ttf'),
-                             (200, 200, 200), (WINDOW_WIDTH // 2, WINDOW_HEIGHT * 2 // 3), 40,
-                             'wave')
-
-    game_over_text = AnimatedText("GAME OVER", join('fonts', 'PixelOperator8-Bold.ttf'),
-                                 (240, 240, 240), (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 3), 80,
-                                 'pulse')
-
-    restart_text = AnimatedText("Press ENTER to Restart", join('fonts', 'PixelOperator8.ttf'),
-                               (200, 200, 200), (WINDOW_WIDTH // 2, WINDOW_HEIGHT * 3 // 4), 40,
-                               'wave')
-
-    speed_boost_sheet = pygame.image.load(join('images', 'speed_boost.png')).convert_alpha()
-    rapid_fire_sheet = pygame.image.load(join('images', 'rapid_fire.png')).convert_alpha()
-    invincibility_sheet = pygame.image.load(join('images', 'invincibility.png')).convert_alpha()
-    star_surf = pygame.image.load(join('images', 'star.png')).convert_alpha()
-    meteor_surf = pygame.image.load(join('images', 'meteor.png')).convert_alpha()
-    laser_surf = pygame.image.load(join('images', 'laser.png')).convert_alpha()
-    enemylaser_surf = pygame.image.load(join('images', 'enemylaser.png')).convert_alpha()
-    explosion_frames = [pygame.image.load(join('images', 'explosion', f'{i}.png')).convert_alpha() for i in range(21)]
-
-    laser_sound = pygame.mixer.Sound(join('audio', 'laser.wav'))
-    laser_sound.set_volume(0.5)
-    explosion_sound = pygame.mixer.Sound(join('audio', 'explosion.wav'))
-    game_music = pygame.mixer.Sound(join('audio', 'game_music.wav'))
-    game_music.set_volume(0.4)
-    game_music.play(-1)
-
-    game_state = GameState.MENU
-    score = 0
-    final_score = 0
-    reset_game()
+    text_cache = TextCache()
+    profiler = Profiler(pygame.font.Font(join('fonts', 'PixelOperator8.ttf'), 12))
+
+    assets = AssetManager()
+    if bundle and os.path.exists(bundle):
+        assets.load_bundle(bundle)
+    star_surf = assets.image('star.png')
+    starfield = Starfield((WINDOW_WIDTH, WINDOW_HEIGHT), star_surf)
+    render_scale = 1.0
+    scene_surface = display_surface
+    assets.mask('player.png')
+    assets.radius('player.png')
+
+    # everything below is cheap and only fills up as gameplay assets arrive
+    particles = None
+    batch_renderer = BatchRenderer()
+    rotation_cache = RotationCache()
+    spatial_hash = SpatialHash()
+    collision_stats = {'tests': 0, 'circle rejects': 0, 'rect rejects': 0, 'mask tests': 0}
+    entity_store = EntityStore() if BATCHED_SIMULATION else None
+    laser_pool = SpritePool(Laser, POOL_CAP)
+    enemy_laser_pool = SpritePool(EnemyLaser, POOL_CAP)
+    explosion_pool = SpritePool(AnimatedExplosion, POOL_CAP)
+    sounds = SoundManager()
+    if fixed_scale != 1:
+        set_render_scale(fixed_scale)
+    create_groups()
+
+    reset_session(seed, spawn_config)
     init_menu_text()
+    register_counters()
+    startup_times['menu'] = time.perf_counter() - load_start
+
+def load_steps(headless=False, effects=None):
+    # particles are purely visual, so headless runs skip them unless asked
+    if effects is None:
+        effects = not headless
+
+    def load_images():
+        global meteor_surf, laser_surf, enemylaser_surf
+        meteor_surf = assets.image('meteor.png')
+        laser_surf = assets.image('laser.png')
+        enemylaser_surf = assets.image('enemylaser.png', 180)
+
+    def load_explosion(i):
+        global explosion_frames
+        assets.image(join('explosion', f'{i}.png'))
+        if i == 20:
+            explosion_frames = assets.sequence('explosion', 21)
+
+    def load_shapes(name, angle):
+        assets.mask(name, angle)
+        assets.radius(name, angle)
+
+    def load_power_up(sheet):
+        assets.frame_masks(sheet)
+        assets.frames_radius(sheet)
+
+    def load_particles():
+        global particles
+        particles = ParticleSystem() if ParticleSystem and effects else None
+        if particles:
+            particles.set_scale(render_scale)
+            profiler.add_counter('particles', lambda: particles.count)
+
+    def load_texts():
+        global game_over_text, restart_text
+        game_over_text = AnimatedText("GAME OVER", join('fonts', 'PixelOperator8-Bold.ttf'),
+                                     (240, 240, 240), (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 3), 80,
+                                     'pulse')
+
+        restart_text = AnimatedText("Press ENTER to Restart", join('fonts', 'PixelOperator8.ttf'),
+                                   (200, 200, 200), (WINDOW_WIDTH // 2, WINDOW_HEIGHT * 3 // 4), 40,
+                                   'wave')
+
+    def load_sounds():
+        sounds.register('player_laser', assets.sound('laser.wav', 0.5), priority=2, reserve=1)
+        sounds.register('enemy_laser', assets.sound('laser.wav', 0.5), max_voices=3)
+        sounds.register('explosion', assets.sound('explosion.wav'), max_voices=4, priority=1)
+
+    steps = [('images', load_images)]
+    steps += [('explosion', lambda i=i: load_explosion(i)) for i in range(21)]
+    steps += [('shapes', lambda name=name, angle=angle: load_shapes(name, angle))
+              for name, angle in (('enemy.png', 180), ('enemylaser.png', 180))]
+    steps += [('power-ups', lambda sheet=sheet: load_power_up(sheet)) for sheet in POWER_UP_SHEETS.values()]
+    steps.append(('meteors', lambda: rotation_cache.prerender(meteor_surf)))
+    if BATCHED_RENDERING and not DIRTY_RENDERING:
+        families = (
+            ('laser', lambda: [laser_surf]),
+            ('enemy laser', lambda: [enemylaser_surf]),
+            ('enemy', lambda: [assets.image('enemy.png', 180)]),
+            ('meteor', lambda: [image for image, mask in rotation_cache.atlas.get(meteor_surf, [])]),
+            ('power-ups', lambda: [frame for sheet in POWER_UP_SHEETS.values() for frame in assets.frames(sheet)]),
+            ('explosion', lambda: explosion_frames)
+        )
+        steps += [('renderer', lambda name=name, surfaces=surfaces: batch_renderer.prepare(name, surfaces()))
+                  for name, surfaces in families]
+    steps.append(('particles', load_particles))
+    steps.append(('text', load_texts))
+    steps.append(('text', lambda: title_text.warm()))
+    steps.append(('text', lambda: start_text.warm()))
+    steps.append(('text', lambda: game_over_text.warm()))
+    steps.append(('text', lambda: restart_text.warm()))
+    steps.append(('sounds', load_sounds))
+    steps.append(('music', lambda: sounds.play_music(['game_music.ogg', 'game_music.wav'], 0.4)))
+    return steps
+
+def init_game(seed=None, headless=False, bundle=BUNDLE_PATH, spawn_config=None, effects=None):
+    global asset_loader
+    init_menu(seed, headless, bundle, spawn_config)
+    asset_loader = StagedLoader(load_steps(headless, effects))
+    asset_loader.run()
+    startup_times['playable'] = time.perf_counter() - load_start
+
+def register_counters():
+    profiler.add_counter('meteors', lambda: len(meteor_sprites))
+    profiler.add_counter('lasers', lambda: len(laser_sprites))
+    profiler.add_counter('enemies', lambda: len(enemy_sprites))
+    profiler.add_counter('enemy lasers', lambda: len(enemy_laser_sprites))
+    profiler.add_counter('power-ups', lambda: len(power_up_sprites))
+    profiler.add_counter('all sprites', lambda: len(all_sprites))
+    profiler.add_counter('text cache hit %', lambda: text_cache.hit_rate() * 100)
+    profiler.add_counter('laser pool hit %', lambda: laser_pool.hit_rate() * 100)
+    profiler.add_counter('explosion pool hit %', lambda: explosion_pool.hit_rate() * 100)
+    profiler.add_counter('asset load ms', lambda: assets.totals()[0] * 1000)
+    profiler.add_counter('asset KiB', lambda: assets.totals()[1] / 1024)
+    profiler.add_counter('sounds played', lambda: sounds.played)
+    profiler.add_counter('sounds deduplicated', lambda: sounds.deduplicated)
+    profiler.add_counter('sounds stolen', lambda: sounds.stolen)
+    profiler.add_counter('queued spawns', lambda: wave_scheduler.queued)
+    profiler.add_counter('pending timers', lambda: game_clock.pending())
+    for name in collision_stats:
+        profiler.add_counter(f'collision {name}', lambda name=name: collision_stats[name])
+    profiler.add_counter('deferred spawns', lambda: wave_scheduler.deferred)
+
+def validate_spawn_config(config):
+    difficulty = config['difficulty']
+    if not isinstance(difficulty, (int, float)) or isinstance(difficulty, bool) or difficulty <= 0:
+        raise ValueError(f"difficulty must be a positive number, got {difficulty!r}")
+    for key, minimum in (('meteor_cap', 0), ('enemy_cap', 0), ('power_up_cap', 0), ('spawns_per_tick', 1)):
+        value = config[key]
+        if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+            raise ValueError(f"{key} must be an integer >= {minimum}, got {value!r}")
+
+def reset_session(seed=None, overrides=None):
+    global rng, game_clock, tick_count, spawn_log, current_controls, recorder, hit_count
+    global game_state, spawn_config, waves
+
+    for sprite in all_sprites.sprites():
+        sprite.kill()
+
+    rng = random.Random(seed)
+    game_clock = GameClock()
+    tick_count = 0
+    spawn_log = []
+    current_controls = 0
+    recorder = None
+    hit_count = 0
+    spawn_config = dict(SPAWN_CONFIG, **(overrides or {}))
+    validate_spawn_config(spawn_config)
+    waves = load_waves(spawn_config['waves'])
 
-    enemy_spawn_event = pygame.event.custom_type()
-    meteor_event = pygame.event.custom_type()
-    power_up_event = pygame.event.custom_type()
-
-    pygame.time.set_timer(enemy_spawn_event, 3000)
-    pygame.time.set_timer(meteor_event, 1000)
-    pygame.time.set_timer(power_up_event, 5000)
-
-    running = True
-    last_time = time.time()
-
-    while running:
-        current_time = time.time()
-        dt = current_time - last_time
-        last_time = current_time
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    if game_state == GameState.MENU:
-                        game_state = GameState.PLAYING
-                    elif game_state == GameState.GAME_OVER:
-                        game_state = GameState.PLAYING
-                        reset_game()
-            if game_state == GameState.PLAYING:
-                if event.type == meteor_event:
-                    if len(meteor_sprites) < 5:
-                        x, y = randint(0, WINDOW_WIDTH), randint(-200, -100)
-                        Meteor(meteor_surf, (x, y), (all_sprites, meteor_sprites))
-                if event.type == enemy_spawn_event:
-                    if len(enemy_sprites) < 3:
-                        EnemyShip((all_sprites, enemy_sprites))
-                if event.type == power_up_event:
-                    if len(power_up_sprites) < 2:
-                        power_type = random.choice(list(PowerUpType))
-                        x = randint(50, WINDOW_WIDTH - 50)
-                        PowerUp((x, -50), power_type, (all_sprites, power_up_sprites))
+    reset_game()
+    game_state = GameState.MENU
 
-        
-        if game_state == GameState.MENU:
+def start_or_restart():
+    global game_state
+    if game_state != GameState.PLAYING:
+        # return pooled lasers and explosions from the last round, and start the waves from the top
+        for sprite in all_sprites.sprites():
+            sprite.kill()
+        reset_game()
+        game_state = GameState.PLAYING
+
+def simulate(dt, controls=0):
+    global tick_count, current_controls
+    current_controls = controls
+    # cooldowns, power-up expiry and spawns fire here, in the order they fall due
+    game_clock.advance(dt)
+    if game_state == GameState.MENU:
+        with profiler.section('update'):
             title_text.update(dt)
             start_text.update(dt)
-            all_sprites.update(dt)
-            draw_menu(display_surface)
+            update_sprites(dt)
 
-        elif game_state == GameState.PLAYING:
-            all_sprites.update(dt)
+    elif game_state == GameState.PLAYING:
+        with profiler.section('update'):
+            update_sprites(dt)
+        with profiler.section('collisions'):
             collisions()
-            display_surface.fill('#3a2e3f')
-            display_score(display_surface, score)
-            all_sprites.draw(display_surface)
 
-        elif game_state == GameState.GAME_OVER:
+    elif game_state == GameState.GAME_OVER:
+        with profiler.section('update'):
             game_over_text.update(dt)
             restart_text.update(dt)
-            all_sprites.update(dt)
-            draw_game_over(display_surface)
-
+            update_sprites(dt)
+    tick_count += 1
+
+def set_render_scale(scale):
+    global render_scale, scene_surface, starfield
+    previous = render_scale
+    render_scale = scale
+    size = (round(WINDOW_WIDTH * scale), round(WINDOW_HEIGHT * scale))
+    if display_surface.get_size() == size:
+        scene_surface = display_surface
+    else:
+        scene_surface = pygame.Surface(size).convert()
+    offsets = starfield.offsets
+    starfield = Starfield(scene_surface.get_size(), star_surf, render_scale=scale)
+    starfield.offsets = [offset * scale / previous for offset in offsets]
+    batch_renderer.set_scale(scale)
+    if particles:
+        particles.set_scale(scale)
+
+def render():
+    surface = scene_surface
+    if game_state == GameState.MENU:
+        draw_menu(surface)
+
+    elif game_state == GameState.PLAYING:
+        if DIRTY_RENDERING:
+            dirty_rects = renderer.draw(score)
+            if particles:
+                # particles are not sprites, so restore what they covered next frame like the profiler overlay
+                particle_rects = particles.draw(display_surface, dirty=True)
+                for rect in particle_rects:
+                    renderer.sprites.repaint_rect(rect)
+                dirty_rects.extend(particle_rects)
+            return dirty_rects
+        draw_background(surface)
+        with profiler.section('score'):
+            display_score(surface, score)
+        draw_sprites(surface)
+
+    elif game_state == GameState.GAME_OVER:
+        draw_game_over(surface)
+
+    if surface is not display_surface:
+        pygame.transform.scale(surface, display_surface.get_size(), display_surface)
+
+def draw_profiler(dirty_rects):
+    if not profiler.visible:
+        return dirty_rects
+    rect = profiler.draw(display_surface)
+    if dirty_rects is not None:
+        # the overlay is not a sprite, so have the dirty renderer restore what it covered next frame
+        dirty_rects.append(rect)
+        renderer.sprites.repaint_rect(rect)
+    return dirty_rects
+
+def draw_paused(dirty_rects):
+    if not game_clock.paused:
+        return dirty_rects
+    text_surf = text_cache.render(font_Bold, 'Paused', (240, 240, 240))
+    rect = display_surface.blit(text_surf, text_surf.get_rect(center=display_surface.get_rect().center))
+    if dirty_rects is not None:
+        dirty_rects.append(rect)
+        renderer.sprites.repaint_rect(rect)
+    return dirty_rects
+
+def capture_positions():
+    global previous_positions
+    previous_positions = {sprite: sprite.rect.center for sprite in all_sprites}
+
+def interpolate_sprites(alpha, max_jump=64):
+    # draw each sprite part of the way back to where it was before the last step, and remember how to undo it
+    moved = []
+    for sprite in all_sprites:
+        previous = previous_positions.get(sprite)
+        if previous is None:
+            continue
+        rect = sprite.rect
+        x, y = rect.center
+        dx = previous[0] - x
+        dy = previous[1] - y
+        # pooled sprites reused during the step would otherwise slide across the screen
+        if (dx or dy) and abs(dx) + abs(dy) < max_jump:
+            moved.append((rect, x, y))
+            rect.center = (x + round(dx * (1 - alpha)), y + round(dy * (1 - alpha)))
+    return moved
+
+def restore_positions(moved):
+    for rect, x, y in moved:
+        rect.center = (x, y)
+
+def render_interpolated(alpha):
+    moved = interpolate_sprites(alpha)
+    dirty_rects = render()
+    restore_positions(moved)
+    return dirty_rects
+
+def present(dirty_rects):
+    if dirty_rects is None:
+        if DIRTY_RENDERING:
+            renderer.repaint()
         pygame.display.flip()
-        await asyncio.sleep(0)
+    else:
+        pygame.display.update(dirty_rects)
+
+# the module globals that make up one running game, everything else is shared assets and caches
+SESSION_GLOBALS = (
+    'rng', 'game_clock', 'tick_count', 'spawn_log', 'current_controls', 'recorder', 'hit_count',
+    'spawn_config', 'waves', 'game_state', 'score', 'final_score', 'player', 'wave_scheduler',
+    'all_sprites', 'meteor_sprites', 'laser_sprites', 'enemy_sprites', 'enemy_laser_sprites',
+    'power_up_sprites', 'renderer', 'laser_pool', 'enemy_laser_pool', 'explosion_pool', 'entity_store'
+)
+
+class GameSession:
+    # several games share one process by swapping their state in and out of the module globals,
+    # which costs a few dict updates instead of copying the world like take_snapshot does
+    def __init__(self, seed=None, spawn_config=None):
+        global laser_pool, enemy_laser_pool, explosion_pool, entity_store
+        laser_pool = SpritePool(Laser, POOL_CAP)
+        enemy_laser_pool = SpritePool(EnemyLaser, POOL_CAP)
+        explosion_pool = SpritePool(AnimatedExplosion, POOL_CAP)
+        entity_store = EntityStore() if BATCHED_SIMULATION else None
+        create_groups()
+        self.reset(seed, spawn_config)
+
+    def reset(self, seed=None, spawn_config=None):
+        # expects this session to be loaded; the starfield restarts too so a seed always gives the same frames
+        reset_session(seed, spawn_config)
+        starfield.offsets[:] = [0.0] * len(starfield.offsets)
+        self.save()
+
+    def save(self):
+        module = globals()
+        self.state = {name: module.get(name) for name in SESSION_GLOBALS}
+        # the starfield is shared and scrolls its offsets in place, so each session keeps its own copy
+        self.offsets = list(starfield.offsets)
+
+    def load(self):
+        globals().update(self.state)
+        starfield.offsets[:] = self.offsets
+
+def named_groups():
+    return meteor_sprites, laser_sprites, enemy_sprites, enemy_laser_sprites, power_up_sprites
+
+def copy_state(state):
+    return {name: value.copy() if isinstance(value, (pygame.Rect, pygame.Vector2, dict)) else value
+            for name, value in state.items() if name != '_Sprite__g'}
+
+def take_snapshot():
+    pools = (laser_pool, enemy_laser_pool, explosion_pool)
+    sprites = set(all_sprites.sprites())
+    for pool in pools:
+        sprites.update(pool.free)
+
+    snapshot = {
+        'clock': game_clock.snapshot(),
+        'tick_count': tick_count,
+        'hit_count': hit_count,
+        'score': score,
+        'final_score': final_score,
+        'game_state': game_state,
+        'player': player,
+        'rng': rng.getstate(),
+        'waves': (wave_scheduler, wave_scheduler.snapshot()),
+        'spawn_log': len(spawn_log),
+        'sprites': [(sprite, copy_state(vars(sprite))) for sprite in sprites],
+        'all_sprites': all_sprites.sprites(),
+        'groups': [group.sprites() for group in named_groups()],
+        'pools': [pool.free[:] for pool in pools],
+        'store': None
+    }
+    if entity_store:
+        count = entity_store.count
+        snapshot['store'] = (count, entity_store.sprites[:], [
+            getattr(entity_store, name)[:count].copy()
+            for name in ('pos', 'vel', 'rotation', 'rotation_speed', 'half_height')
+        ])
+    return snapshot
+
+def restore_snapshot(snapshot):
+    global tick_count, hit_count, score, final_score, game_state, player, wave_scheduler
+
+    game_clock.restore(snapshot['clock'])
+    tick_count = snapshot['tick_count']
+    hit_count = snapshot['hit_count']
+    score = snapshot['score']
+    final_score = snapshot['final_score']
+    game_state = snapshot['game_state']
+    player = snapshot['player']
+    rng.setstate(snapshot['rng'])
+    # queued timers call back into this scheduler, so bring back the object and not just its state
+    wave_scheduler, state = snapshot['waves']
+    wave_scheduler.restore(state)
+    if particles:
+        particles.clear()
+    del spawn_log[snapshot['spawn_log']:]
+
+    # copy again so the same snapshot can be restored any number of times
+    for sprite, state in snapshot['sprites']:
+        vars(sprite).clear()
+        vars(sprite).update(copy_state(state))
+        vars(sprite)['_Sprite__g'] = {}
+    create_groups()
+    all_sprites.add(*snapshot['all_sprites'])
+    for group, members in zip(named_groups(), snapshot['groups']):
+        group.add(*members)
+    for pool, free in zip((laser_pool, enemy_laser_pool, explosion_pool), snapshot['pools']):
+        pool.free = free[:]
+
+    if entity_store:
+        count, sprites, arrays = snapshot['store']
+        entity_store.count = count
+        entity_store.sprites = sprites[:]
+        entity_store.rects = [sprite.rect for sprite in sprites]
+        for name, array in zip(('pos', 'vel', 'rotation', 'rotation_speed', 'half_height'), arrays):
+            getattr(entity_store, name)[:count] = array
+
+class ReplayPlayer:
+    def __init__(self, replay, snapshot_interval=600):
+        self.replay = replay
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = {0: take_snapshot()}
+        self.tick = 0
+
+    def finished(self):
+        return self.tick >= len(self.replay)
+
+    def step(self):
+        if self.tick in self.replay.starts:
+            start_or_restart()
+        simulate(self.replay.dts[self.tick], self.replay.controls[self.tick])
+        self.tick += 1
+        if self.tick % self.snapshot_interval == 0 and self.tick not in self.snapshots:
+            self.snapshots[self.tick] = take_snapshot()
+
+    def seek(self, target):
+        target = max(0, min(target, len(self.replay)))
+        if target < self.tick:
+            base = max(tick for tick in self.snapshots if tick <= target)
+            restore_snapshot(self.snapshots[base])
+            self.tick = base
+        while self.tick < target:
+            self.step()
+
+    def in_sync(self):
+        expected = [tuple(spawn) for spawn in self.replay.spawns if spawn[0] < self.tick]
+        return spawn_log == expected
+
+def replay_headless(path, draw=False):
+    replay = read_replay(path, RULESET)
+    init_game(replay.seed, headless=True)
+    replay_player = ReplayPlayer(replay)
+    start = time.perf_counter()
+    while not replay_player.finished():
+        replay_player.step()
+        if draw:
+            render()
+    elapsed = time.perf_counter() - start
+    return {
+        'seed': replay.seed,
+        'ticks': replay_player.tick,
+        'score': final_score if game_state == GameState.GAME_OVER else score,
+        'in_sync': replay_player.in_sync(),
+        'seconds': elapsed,
+        'ticks_per_second': replay_player.tick / elapsed if elapsed else 0.0
+    }
+
+async def watch_replay(path, seek=0, seek_step=300, fps=FPS_CAP):
+    replay = read_replay(path, RULESET)
+    init_game(replay.seed)
+    replay_player = ReplayPlayer(replay)
+    replay_player.seek(seek)
+    pacer = FrameScheduler(FIXED_DT, fps)
+    capture_positions()
+
+    running = True
+    while running and not replay_player.finished():
+        profiler.tick()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    replay_player.seek(replay_player.tick - seek_step)
+                elif event.key == pygame.K_RIGHT:
+                    replay_player.seek(replay_player.tick + seek_step)
+                elif event.key == pygame.K_F3:
+                    profiler.visible = not profiler.visible
+
+        steps = pacer.advance()
+        for step in range(steps):
+            if replay_player.finished():
+                break
+            if step == steps - 1:
+                capture_positions()
+            replay_player.step()
+        present(draw_profiler(render_interpolated(pacer.alpha)))
+        await pacer.wait()
+
+def random_policy(policy_rng):
+    def policy(tick):
+        return policy_rng.getrandbits(len(CONTROL_KEYS))
+    return policy
+
+def run_headless(ticks, seed=0, policy=None, draw=False, restart=True):
+    if not pygame.display.get_init():
+        init_game(seed, headless=True)
+    start_or_restart()
+
+    scores = []
+    # tick + 1 is the number of ticks run, also when none are
+    tick = -1
+    start = time.perf_counter()
+    for tick in range(ticks):
+        simulate(FIXED_DT, policy(tick) if policy else 0)
+        if draw:
+            render()
+        if game_state == GameState.GAME_OVER:
+            scores.append(final_score)
+            if not restart:
+                break
+            start_or_restart()
+    elapsed = time.perf_counter() - start
+
+    if game_state == GameState.PLAYING:
+        scores.append(score)
+    return {
+        'seed': seed,
+        'ticks': tick + 1,
+        'games': len(scores),
+        'scores': scores,
+        'seconds': elapsed,
+        'ticks_per_second': (tick + 1) / elapsed if elapsed else 0.0
+    }
+
+async def main(record_dir='replays', fps=FPS_CAP, idle_fps=IDLE_FPS):
+    global recorder, asset_loader
+    seed = random.randrange(2 ** 62)
+    # show the menu first and stream the gameplay assets in behind it
+    init_menu(seed)
+    asset_loader = StagedLoader(load_steps())
+    loading = asyncio.create_task(asset_loader.load())
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+        recorder = ReplayWriter(join(record_dir, time.strftime('%Y%m%d-%H%M%S') + '.ssr'), seed, RULESET)
+    pacer = FrameScheduler(FIXED_DT, fps, idle_fps)
+    profiler.add_counter('steps per frame', lambda: pacer.steps)
+    profiler.add_counter('dropped ms', lambda: pacer.dropped * 1000)
+    profiler.add_counter('render scale %', lambda: render_scale * 100)
+    profiler.add_counter('first frame ms', lambda: startup_times.get('first frame', 0) * 1000)
+    profiler.add_counter('playable ms', lambda: startup_times.get('playable', 0) * 1000)
+    auto_scale = AutoScale(RENDER_SCALES, 1 / fps) if RENDER_SCALE == 'auto' and not DIRTY_RENDERING else None
+    capture_positions()
+
+    running = True
+    while running:
+        profiler.tick()
+
+        with profiler.section('events'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_RETURN and asset_loader.finished():
+                        if recorder:
+                            recorder.record_start()
+                        start_or_restart()
+                    elif event.key == pygame.K_p and game_state == GameState.PLAYING:
+                        game_clock.paused = not game_clock.paused
+                    elif event.key == pygame.K_F3:
+                        profiler.visible = not profiler.visible
+                    elif event.key == pygame.K_F4:
+                        if profiler.recording:
+                            profiler.stop_recording()
+                        else:
+                            profiler.start_recording()
+                    elif event.key == pygame.K_F5:
+                        game_clock.scale = SLOW_MOTION if game_clock.scale == 1 else 1
+
+        controls = keyboard_controls()
+        steps = pacer.advance()
+        if game_clock.paused:
+            steps = 0
+        # the recording keeps the scaled step, so replays play back slow motion without knowing about it
+        dt = FIXED_DT * game_clock.scale
+        for step in range(steps):
+            if step == steps - 1:
+                capture_positions()
+            if recorder:
+                recorder.record_tick(controls, dt)
+            simulate(dt, controls)
+        with profiler.section('draw'):
+            alpha = 1 if game_clock.paused else pacer.alpha
+            dirty_rects = draw_profiler(draw_paused(render_interpolated(alpha)))
+        with profiler.section('flip'):
+            present(dirty_rects)
+        if 'first frame' not in startup_times:
+            startup_times['first frame'] = time.perf_counter() - load_start
+        if loading and loading.done():
+            loading.result()
+            loading = None
+            startup_times['playable'] = time.perf_counter() - load_start
+        # the menu, game over and pause screens only animate a little, so they do not need the full frame rate
+        idle = game_state != GameState.PLAYING or game_clock.paused or not pygame.display.get_active()
+        # keep full speed while loading, the loader only runs between frames
+        idle = idle and not loading
+        if auto_scale and not idle:
+            scale = auto_scale.update(pacer.busy)
+            if scale:
+                set_render_scale(scale)
+        await pacer.wait(idle)
+
+    if recorder:
+        recorder.close()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Space shooter')
+    parser.add_argument('--headless', action='store_true', help='run the simulation without a window or audio')
+    parser.add_argument('--ticks', type=int, default=10000, help='fixed timesteps to simulate in headless mode')
+    parser.add_argument('--seed', type=int, default=0, help='seed for spawns and the random input policy')
+    parser.add_argument('--draw', action='store_true', help='still render every tick in headless mode')
+    parser.add_argument('--replay', metavar='FILE', help='play back a recorded session')
+    parser.add_argument('--seek', type=int, default=0, help='tick to start watching a replay from')
+    parser.add_argument('--no-record', action='store_true', help='do not record this session to replays/')
+    parser.add_argument('--render-scale', default=RENDER_SCALE,
+                        type=lambda value: value if value == 'auto' else float(value),
+                        help="draw at this fraction of the window size, or 'auto' to follow the frame time")
+    parser.add_argument('--asset-report', action='store_true', help='load every asset, print what each cost and exit')
+    parser.add_argument('--fps', type=int, default=FPS_CAP, help='frame rate cap while playing')
+    parser.add_argument('--idle-fps', type=int, default=IDLE_FPS, help='frame rate on the menu and game over screens')
+    args = parser.parse_args()
+    RENDER_SCALE = args.render_scale
+    DIRTY_RENDERING = DIRTY_RENDERING and RENDER_SCALE == 1
+
+    if args.replay:
+        try:
+            read_replay(args.replay, RULESET)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+
+    if args.asset_report:
+        init_game(args.seed, headless=True)
+        print(assets.report())
+    elif args.replay and args.headless:
+        result = replay_headless(args.replay, args.draw)
+        print(f"{result['ticks']} ticks, score {result['score']}, "
+              f"{'in sync' if result['in_sync'] else 'DESYNC'}, {result['ticks_per_second']:.0f} ticks/s")
+    elif args.replay:
+        asyncio.run(watch_replay(args.replay, args.seek, fps=args.fps))
+    elif args.headless:
+        result = run_headless(args.ticks, args.seed, random_policy(random.Random(args.seed)), args.draw)
+        print(f"{result['ticks']} ticks, {result['games']} games, scores {result['scores']}, "
+              f"{result['ticks_per_second']:.0f} ticks/s")
+    else:
+        asyncio.run(main(None if args.no_record else 'replays', args.fps, args.idle_fps))
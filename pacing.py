@@ -0,0 +1,89 @@
+import asyncio
+import sys
+import time
+
+import pygame
+
+class FrameScheduler:
+    def __init__(self, step, fps=60, idle_fps=15, max_steps=5):
+        self.step = step
+        self.fps = fps
+        self.idle_fps = idle_fps
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.last = None
+        self.deadline = None
+        self.steps = 0
+        self.dropped = 0.0
+        self.busy = 0.0
+
+    @property
+    def alpha(self):
+        return self.accumulator / self.step
+
+    def advance(self):
+        now = time.perf_counter()
+        elapsed = self.step if self.last is None else now - self.last
+        self.last = now
+        limit = self.step * self.max_steps
+        if elapsed > limit:
+            # after a stall drop the backlog, otherwise catching up makes the next frame even slower
+            self.dropped += elapsed - limit
+            elapsed = limit
+        self.accumulator += elapsed
+        self.steps = int(self.accumulator / self.step)
+        self.accumulator -= self.steps * self.step
+        return self.steps
+
+    async def wait(self, idle=False):
+        period = 1 / (self.idle_fps if idle else self.fps)
+        now = time.perf_counter()
+        self.busy = now - self.last
+        if self.deadline is None or now - self.deadline > period:
+            # too far behind to catch up, so pace from now rather than rushing the next frames
+            self.deadline = now
+        self.deadline += period
+        delay = self.deadline - time.perf_counter()
+        if sys.platform == 'emscripten':
+            # the browser only gets to draw while we are awaiting
+            await asyncio.sleep(max(0, delay))
+        else:
+            if delay > 0:
+                pygame.time.wait(int(delay * 1000))
+            await asyncio.sleep(0)
+
+class AutoScale:
+    def __init__(self, scales, budget, window=30, calm_windows=4):
+        self.scales = scales
+        self.budget = budget
+        self.window = window
+        self.calm_windows = calm_windows
+        self.index = 0
+        self.samples = []
+        self.calm = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.index]
+
+    def update(self, busy):
+        # returns a new scale when the frame cost calls for one, otherwise None
+        self.samples.append(busy)
+        if len(self.samples) < self.window:
+            return None
+        average = sum(self.samples) / len(self.samples)
+        self.samples = []
+        if average > self.budget * 0.9 and self.index < len(self.scales) - 1:
+            self.index += 1
+            self.calm = 0
+            return self.scale
+        if average < self.budget * 0.4 and self.index > 0:
+            # only go back up after a run of cheap frames, so one quiet moment does not cause flicker
+            self.calm += 1
+            if self.calm == self.calm_windows:
+                self.index -= 1
+                self.calm = 0
+                return self.scale
+            return None
+        self.calm = 0
+        return None
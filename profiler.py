@@ -0,0 +1,153 @@
+import csv
+import functools
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pygame
+
+class Profiler:
+    def __init__(self, font, history=240, record_limit=36000, trace_limit=200000):
+        self.font = font
+        self.history = deque(maxlen=history)
+        self.recorded = deque(maxlen=record_limit)
+        self.trace = deque(maxlen=trace_limit)
+        self.counters = {}
+        self.sections = {}
+        self.frame_start = None
+        self.origin = time.perf_counter()
+        self.visible = False
+        self.recording = False
+
+        self.lines = []
+        self.lines_time = 0
+        self.refresh_interval = 0.25
+
+    def add_counter(self, name, read):
+        self.counters[name] = read
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.sections[name] = self.sections.get(name, 0) + end - start
+            if self.recording:
+                self.trace.append((name, start, end - start))
+
+    def timed(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.section(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            frame = {'frame': now - self.frame_start}
+            frame.update(self.sections)
+            if self.visible or self.recording:
+                for name, read in self.counters.items():
+                    frame[name] = read()
+            self.history.append(frame)
+            if self.recording:
+                self.recorded.append(frame)
+        self.sections = {}
+        self.frame_start = now
+
+    def averages(self):
+        totals = {}
+        counts = {}
+        for frame in self.history:
+            for name, value in frame.items():
+                totals[name] = totals.get(name, 0) + value
+                counts[name] = counts.get(name, 0) + 1
+        return {name: total / counts[name] for name, total in totals.items()}
+
+    def start_recording(self):
+        self.recorded.clear()
+        self.trace.clear()
+        self.recording = True
+
+    def stop_recording(self, csv_path='profile.csv', trace_path='profile_trace.json'):
+        self.recording = False
+        self.export_csv(csv_path)
+        self.export_chrome_trace(trace_path)
+
+    def export_csv(self, path):
+        frames = list(self.recorded or self.history)
+        columns = []
+        for frame in frames:
+            columns.extend(name for name in frame if name not in columns)
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['index'] + [name if name in self.counters else f'{name}_ms' for name in columns])
+            for index, frame in enumerate(frames):
+                row = [index]
+                for name in columns:
+                    value = frame.get(name)
+                    if value is not None and name not in self.counters:
+                        value = round(value * 1000, 4)
+                    row.append('' if value is None else value)
+                writer.writerow(row)
+
+    def export_chrome_trace(self, path):
+        # load the file in chrome://tracing or https://ui.perfetto.dev
+        events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': 0,
+            'tid': 0
+        } for name, start, duration in self.trace]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def refresh_lines(self):
+        averages = self.averages()
+        frame_time = averages.get('frame', 0)
+        lines = [f"FPS {1 / frame_time if frame_time else 0:5.1f}  frame {frame_time * 1000:5.2f} ms"]
+        if self.recording:
+            lines[0] += '  REC'
+        for name, value in averages.items():
+            if name == 'frame':
+                continue
+            if name in self.counters:
+                lines.append(f"{name:<20}{value:8.1f}")
+            else:
+                lines.append(f"{name:<20}{value * 1000:8.2f} ms")
+        self.lines = [self.font.render(line, False, (240, 240, 240)) for line in lines]
+
+    def draw(self, surface, pos=(10, 10), width=320, graph_height=60, budget=1 / 60):
+        now = time.perf_counter()
+        if now - self.lines_time >= self.refresh_interval:
+            self.refresh_lines()
+            self.lines_time = now
+
+        line_height = self.font.get_linesize()
+        rect = pygame.Rect(pos, (width, graph_height + 16 + line_height * len(self.lines)))
+        surface.fill((90, 90, 90), rect, special_flags=pygame.BLEND_RGB_MULT)
+
+        # frame-time graph, scaled so the frame budget sits at half height
+        graph_bottom = rect.top + 8 + graph_height
+        scale = graph_height / (budget * 2)
+        frames = list(self.history)[-(width - 16):]
+        for x, frame in enumerate(frames, start=rect.left + 8):
+            height = min(graph_height, int(frame['frame'] * scale))
+            color = (120, 220, 120) if frame['frame'] <= budget * 1.05 else (240, 120, 80)
+            pygame.draw.line(surface, color, (x, graph_bottom), (x, graph_bottom - height))
+        budget_y = graph_bottom - int(budget * scale)
+        pygame.draw.line(surface, (200, 200, 200), (rect.left + 8, budget_y), (rect.right - 8, budget_y))
+
+        y = graph_bottom + 8
+        for line in self.lines:
+            surface.blit(line, (rect.left + 8, y))
+            y += line_height
+        return rect
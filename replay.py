@@ -0,0 +1,117 @@
+import struct
+from array import array
+
+# Replay files are a header followed by an append-only stream of records:
+#   0x00-0x1f        one tick with that control bitmask
+#   0x20 <u16 n>     n more ticks with the previous controls
+#   0x40 <f64 dt>    timestep used by the following ticks
+#   0x41             ENTER pressed before the next tick
+#   0x42 <u32 tick> <u8 kind>   a spawn fired during that tick
+# the header is the magic, the file format version, the ruleset the game ran and the seed
+MAGIC = b'SSRP'
+VERSION = 2
+HEADER = struct.Struct('<4sBHq')
+
+RECORD_REPEAT = 0x20
+RECORD_DT = 0x40
+RECORD_START = 0x41
+RECORD_SPAWN = 0x42
+MAX_RUN = 0xffff
+
+class ReplayWriter:
+    def __init__(self, path, seed, ruleset=0, flush_interval=600):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, ruleset, seed))
+        self.flush_interval = flush_interval
+        self.dt = None
+        self.controls = None
+        self.run = 0
+        self.ticks = 0
+
+    def flush_run(self):
+        if self.run:
+            self.file.write(struct.pack('<BH', RECORD_REPEAT, self.run))
+            self.run = 0
+
+    def record_start(self):
+        self.flush_run()
+        self.file.write(bytes((RECORD_START,)))
+
+    def record_spawn(self, tick, kind):
+        self.flush_run()
+        self.file.write(struct.pack('<BIB', RECORD_SPAWN, tick, kind))
+
+    def record_tick(self, controls, dt):
+        if dt != self.dt:
+            self.flush_run()
+            self.file.write(struct.pack('<Bd', RECORD_DT, dt))
+            self.dt = dt
+        if controls == self.controls and self.run < MAX_RUN:
+            self.run += 1
+        else:
+            self.flush_run()
+            self.file.write(bytes((controls,)))
+            self.controls = controls
+        self.ticks += 1
+        if self.ticks % self.flush_interval == 0:
+            self.file.flush()
+
+    def close(self):
+        self.flush_run()
+        self.file.close()
+
+class Replay:
+    def __init__(self, seed, ruleset):
+        self.seed = seed
+        self.ruleset = ruleset
+        self.controls = bytearray()
+        self.dts = array('d')
+        self.starts = set()
+        self.spawns = []
+
+    def __len__(self):
+        return len(self.controls)
+
+def read_replay(path, ruleset=None):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < 5 or data[:4] != MAGIC:
+        raise ValueError(f"{path} is not a replay")
+    if data[4] != VERSION:
+        raise ValueError(f"{path} is a version {data[4]} replay, this build reads version {VERSION}")
+    magic, version, recorded, seed = HEADER.unpack_from(data)
+    # inputs only reproduce a game under the rules they were recorded with, so refuse instead of desyncing
+    if ruleset is not None and recorded != ruleset:
+        raise ValueError(f"{path} was recorded with ruleset {recorded}, this build plays ruleset {ruleset}")
+
+    replay = Replay(seed, recorded)
+    offset = HEADER.size
+    dt = 0.0
+    controls = 0
+    while offset < len(data):
+        record = data[offset]
+        offset += 1
+        try:
+            if record < RECORD_REPEAT:
+                controls = record
+                replay.controls.append(controls)
+                replay.dts.append(dt)
+            elif record == RECORD_REPEAT:
+                count, = struct.unpack_from('<H', data, offset)
+                offset += 2
+                replay.controls.extend(bytes((controls,)) * count)
+                replay.dts.extend(array('d', [dt]) * count)
+            elif record == RECORD_DT:
+                dt, = struct.unpack_from('<d', data, offset)
+                offset += 8
+            elif record == RECORD_START:
+                replay.starts.add(len(replay.controls))
+            elif record == RECORD_SPAWN:
+                replay.spawns.append(struct.unpack_from('<IB', data, offset))
+                offset += 5
+            else:
+                raise ValueError(f"unknown replay record {record:#x} at byte {offset - 1}")
+        except struct.error:
+            # a session that ended mid-write leaves a torn last record, keep everything before it
+            break
+    return replay